@@ -0,0 +1,290 @@
+"""
+Benchmark the search backends on synthetic corpora.
+
+Word frequencies in natural text follow Zipf's law: the n-th most frequent word
+appears about 1 / n ** s times as often as the most frequent one (s is close to 1).
+The corpus and the query log are drawn from such a distribution, so postings list
+lengths look like those of a real index: a few huge lists and a long tail of short ones.
+
+For every backend, and every scorer it supports, the benchmark reports:
+
+    build      seconds to index the corpus
+    size       bytes of the .bin files for on-disk indexes, bytes allocated while building
+               (measured with tracemalloc in a second build) for in-memory ones
+    p50, p99   query latency percentiles in milliseconds
+    qps        queries per second, one query at a time
+
+    python benchmark.py --documents 20000 --queries 1000 --backends inverted mapped
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from itertools import accumulate
+
+from dense_index import DenseVectorIndex
+from index_format import MappedIndex
+from indexer import SpimiIndexer
+from inverted_index import InvertedIndex
+from live_index import LiveIndex
+from postings_codecs import compress_index
+from scoring import SCORERS
+from sparse_index import SparseMatrixIndex
+from term_dictionary import TermVectorStore
+from vector_compare import VectorCompare
+
+
+def zipf_words(vocabulary_size, exponent=1.0):
+    """
+    Return a vocabulary and the cumulative weights to draw from it with random.choices.
+    """
+    vocabulary = ['w{}'.format(rank) for rank in range(vocabulary_size)]
+    return vocabulary, list(accumulate(1 / (rank + 1) ** exponent for rank in range(vocabulary_size)))
+
+
+def zipf_documents(documents=10000, vocabulary_size=50000, min_length=50, max_length=500, exponent=1.0, seed=0):
+    """
+    Yield the word lists of documents whose words follow Zipf's law.
+    """
+    generator = random.Random(seed)
+    vocabulary, cum_weights = zipf_words(vocabulary_size, exponent)
+    for _ in range(documents):
+        yield generator.choices(vocabulary, cum_weights=cum_weights, k=generator.randint(min_length, max_length))
+
+
+def zipf_corpus(documents=10000, vocabulary_size=50000, min_length=50, max_length=500, exponent=1.0, seed=0):
+    """
+    Generate documents whose words follow Zipf's law.
+
+    Returns:
+        list: (source, text) tuples, like indexer.read_documents.
+    """
+    return [
+        ('doc{}'.format(doc_id), ' '.join(words))
+        for doc_id, words in enumerate(
+            zipf_documents(documents, vocabulary_size, min_length, max_length, exponent, seed))
+    ]
+
+
+def zipf_concordances(documents=10000, vocabulary_size=50000, min_length=50, max_length=500, exponent=1.0, seed=0):
+    """
+    Generate the concordances of the documents of zipf_corpus (with the same arguments),
+    without joining and splitting their text.
+
+    Returns:
+        dict: doc_id -> Counter of words, with doc ids 0, 1, 2, ...
+    """
+    return {
+        doc_id: Counter(words)
+        for doc_id, words in enumerate(
+            zipf_documents(documents, vocabulary_size, min_length, max_length, exponent, seed))
+    }
+
+
+def zipf_queries(queries=1000, vocabulary_size=50000, min_terms=1, max_terms=4, exponent=1.0, seed=1):
+    """
+    Generate a query log drawn from the same distribution as zipf_corpus, so popular
+    words are also the most queried ones.
+
+    Returns:
+        list: Query strings.
+    """
+    generator = random.Random(seed)
+    vocabulary, cum_weights = zipf_words(vocabulary_size, exponent)
+    return [
+        ' '.join(generator.choices(vocabulary, cum_weights=cum_weights, k=generator.randint(min_terms, max_terms)))
+        for _ in range(queries)
+    ]
+
+
+# Builders take the (source, text) documents and a scratch directory and return an
+# object with a search(query concordance, k, ...) method
+
+def build_inverted(documents, directory):
+    v = VectorCompare()
+    index = InvertedIndex()
+    for doc_id, (_, text) in enumerate(documents):
+        index.add_document(doc_id, v.concordance(text.lower()))
+    return index
+
+
+def build_mapped(documents, directory):
+    SpimiIndexer(directory).index(iter(documents))
+    return MappedIndex(directory)
+
+
+def build_compressed(documents, directory):
+    return compress_index(build_inverted(documents, directory), 'for')
+
+
+def build_live(documents, directory):
+    v = VectorCompare()
+    index = LiveIndex(background=False)
+    for doc_id, (_, text) in enumerate(documents):
+        index.add_document(doc_id, v.concordance(text.lower()))
+    index.flush()
+    return index
+
+
+def build_sparse(documents, directory):
+    v = VectorCompare()
+    return SparseMatrixIndex({doc_id: v.concordance(text.lower()) for doc_id, (_, text) in enumerate(documents)})
+
+
+def build_dense(documents, directory):
+    v = VectorCompare()
+    index = DenseVectorIndex(256, 'simhash')
+    for doc_id, (_, text) in enumerate(documents):
+        index.add_document(doc_id, v.concordance(text.lower()))
+    return index
+
+
+def build_term_vectors(documents, directory):
+    v = VectorCompare()
+    store = TermVectorStore()
+    for doc_id, (_, text) in enumerate(documents):
+        store.add_document(doc_id, v.concordance(text.lower()))
+    return store
+
+
+# name -> (builder, whether the index lives on disk, scorers it supports)
+BACKENDS = {
+    'inverted': (build_inverted, False, tuple(SCORERS)),
+    'mapped': (build_mapped, True, tuple(SCORERS)),
+    'compressed': (build_compressed, False, tuple(SCORERS)),
+    'live': (build_live, False, tuple(SCORERS)),
+    'sparse': (build_sparse, False, ('cosine',)),
+    'dense': (build_dense, False, ('cosine',)),
+    'terms': (build_term_vectors, False, ('cosine',)),
+}
+
+
+def index_files_size(directory):
+    """
+    Return the bytes of the binary index files (*.bin) of a directory.
+    """
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for name in os.listdir(directory)
+        if name.endswith('.bin')
+    )
+
+
+def allocated_size(build, documents, directory):
+    """
+    Return the bytes still allocated after building an index (and keeping it alive).
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        index = build(documents, directory)
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del index
+    return size
+
+
+def percentile(sorted_values, fraction):
+    """
+    Return the value below which a fraction of the sorted values fall (nearest rank).
+    """
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def benchmark_backend(name, documents, queries, k=10):
+    """
+    Build one backend and run the query log against it with every scorer it supports.
+
+    Returns:
+        list: One dict per scorer with the keys backend, scorer, build, size, p50, p99 and qps.
+    """
+    build, on_disk, scorer_names = BACKENDS[name]
+    v = VectorCompare()
+    query_concordances = [dict(v.query_vector(query)) for query in queries]
+
+    directory = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        start = time.perf_counter()
+        index = build(documents, directory)
+        build_seconds = time.perf_counter() - start
+        if on_disk:
+            size = index_files_size(directory)
+        else:
+            size = allocated_size(build, documents, tempfile.mkdtemp(dir=directory))
+
+        results = []
+        for scorer_name in scorer_names:
+            # Backends supporting a single scorer take no scorer argument
+            options = {'scorer': SCORERS[scorer_name]} if len(scorer_names) > 1 else {}
+            latencies = []
+            total_start = time.perf_counter()
+            for query in query_concordances:
+                start = time.perf_counter()
+                index.search(query, k, **options)
+                latencies.append(time.perf_counter() - start)
+            total = time.perf_counter() - total_start
+
+            latencies.sort()
+            results.append({
+                'backend': name,
+                'scorer': scorer_name,
+                'build': build_seconds,
+                'size': size,
+                'p50': percentile(latencies, 0.50) * 1000,
+                'p99': percentile(latencies, 0.99) * 1000,
+                'qps': len(queries) / total if total else 0,
+            })
+
+        if hasattr(index, 'close'):
+            index.close()
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_benchmark(backends, documents=10000, queries=1000, vocabulary_size=50000, exponent=1.0, k=10, seed=0):
+    """
+    Generate a corpus and a query log, and benchmark every backend on them.
+    """
+    corpus = zipf_corpus(documents, vocabulary_size, exponent=exponent, seed=seed)
+    query_log = zipf_queries(queries, vocabulary_size, exponent=exponent, seed=seed + 1)
+    results = []
+    for name in backends:
+        results.extend(benchmark_backend(name, corpus, query_log, k))
+    return results
+
+
+def format_results(results):
+    lines = ['{:<11} {:<7} {:>9} {:>10} {:>9} {:>9} {:>9}'.format(
+        'backend', 'scorer', 'build s', 'size MB', 'p50 ms', 'p99 ms', 'qps')]
+    for result in results:
+        lines.append('{backend:<11} {scorer:<7} {build:9.2f} {size_mb:10.2f} {p50:9.3f} {p99:9.3f} {qps:9.0f}'.format(
+            size_mb=result['size'] / 1e6, **result))
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Benchmark the search backends on a synthetic Zipf corpus.')
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--vocabulary', type=int, default=50000, help='number of distinct words')
+    parser.add_argument('--exponent', type=float, default=1.0, help='Zipf exponent of word frequencies')
+    parser.add_argument('-k', type=int, default=10, help='results per query')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.backends, args.documents, args.queries, args.vocabulary, args.exponent, args.k,
+                            args.seed)
+    print(json.dumps(results, indent=2) if args.json else format_results(results))
@@ -0,0 +1,221 @@
+"""
+Boolean queries over an InvertedIndex (or MappedIndex).
+
+    mysql AND (backup OR dump) AND NOT windows
+    captcha numbers (words next to each other without an operator are joined by AND)
+
+Double quotes are ignored: "captcha numbers" is the same query as captcha numbers,
+not a phrase (see positional_index.py for phrases).
+
+Results are the ids of the matching documents, in increasing order, without scores.
+
+Conjunctions are evaluated from the shortest postings list to the longest: the
+running result can only shrink, and every id in it is looked up in the next list with
+a galloping (exponential) search. The search jumps 1, 2, 4, 8, ... entries ahead
+until it passes the id, then binary searches the last jump, so looking up m sorted
+ids in a list of n entries costs about m * log(n / m) instead of n.
+"""
+
+
+import heapq
+import re
+from bisect import bisect_left
+from operator import itemgetter
+
+
+TOKEN = re.compile(r'\(|\)|[^\s()]+')
+OPERATORS = ('AND', 'OR', 'NOT')
+doc_id_of = itemgetter(0)  # Key of a (doc_id, count) posting
+MATCH_NOTHING = ('or', [])
+
+
+def gallop(sequence, target, low=0, key=None):
+    """
+    Return the first index at or after low whose value (key(item) if key is given) is
+    not smaller than target, or len(sequence).
+    """
+    value = key or (lambda item: item)
+    bound = 1
+    while low + bound < len(sequence) and value(sequence[low + bound]) < target:
+        bound *= 2
+    return bisect_left(sequence, target, low, min(low + bound + 1, len(sequence)), key=key)
+
+
+def intersect(doc_ids, sequence, key=None):
+    """
+    Keep the ids of doc_ids (sorted ints) that are also in sequence (sorted).
+    """
+    result = []
+    position = 0
+    for doc_id in doc_ids:
+        position = gallop(sequence, doc_id, position, key)
+        if position == len(sequence):
+            break
+        if (key(sequence[position]) if key else sequence[position]) == doc_id:
+            result.append(doc_id)
+    return result
+
+
+def subtract(doc_ids, sequence, key=None):
+    """
+    Keep the ids of doc_ids (sorted ints) that are not in sequence (sorted).
+    """
+    result = []
+    position = 0
+    for doc_id in doc_ids:
+        position = gallop(sequence, doc_id, position, key)
+        if position == len(sequence) or (key(sequence[position]) if key else sequence[position]) != doc_id:
+            result.append(doc_id)
+    return result
+
+
+def union(lists):
+    """
+    Merge sorted (sequence, key) lists into one sorted list of ids without duplicates.
+    """
+    streams = [map(key, sequence) if key else iter(sequence) for sequence, key in lists]
+    result = []
+    for doc_id in heapq.merge(*streams):
+        if not result or result[-1] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+class BooleanSearcher:
+    """
+    Parse and run boolean queries against an index.
+
+    Args:
+        index: An InvertedIndex or MappedIndex.
+        tokenizer (Tokenizer): How the index was tokenized. Without one, words are
+            lowercased, like VectorCompare.concordance does.
+    """
+
+    def __init__(self, index, tokenizer=None):
+        self.index = index
+        self.tokenizer = tokenizer
+
+    def parse(self, query):
+        """
+        Turn a query into a tree of tuples:
+
+            ('term', word), ('not', node), ('and', [nodes]), ('or', [nodes])
+
+        AND binds tighter than OR, and NOT tighter than AND. Words that the tokenizer
+        drops (stopwords) are left out of the tree.
+
+        Raises:
+            ValueError: If the query is not well formed.
+        """
+        self._tokens = TOKEN.findall(query)
+        self._position = 0
+        if not self._tokens:
+            return MATCH_NOTHING
+        node = self._parse_or()
+        if self._position != len(self._tokens):
+            raise ValueError('Unexpected {!r} in query'.format(self._tokens[self._position]))
+        return node or MATCH_NOTHING
+
+    def _peek(self):
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError('Query ends too early')
+        self._position += 1
+        return token
+
+    def _parse_or(self):
+        children = [self._parse_and()]
+        while self._peek() == 'OR':
+            self._next()
+            children.append(self._parse_and())
+        return self._combine('or', children)
+
+    def _parse_and(self):
+        children = [self._parse_not()]
+        while self._peek() is not None and self._peek() not in ('OR', ')'):
+            if self._peek() == 'AND':
+                self._next()
+            children.append(self._parse_not())
+        return self._combine('and', children)
+
+    @staticmethod
+    def _combine(kind, children):
+        # None stands for a dropped word
+        children = [child for child in children if child is not None]
+        if len(children) <= 1:
+            return children[0] if children else None
+        return (kind, children)
+
+    def _parse_not(self):
+        if self._peek() == 'NOT':
+            self._next()
+            node = self._parse_not()
+            return None if node is None else ('not', node)
+        return self._parse_primary()
+
+    def _parse_primary(self):
+        token = self._next()
+        if token == '(':
+            node = self._parse_or()
+            if self._next() != ')':
+                raise ValueError('Missing )')
+            return node
+        if token in OPERATORS or token == ')':
+            raise ValueError('Unexpected {!r} in query'.format(token))
+        return self._term(token)
+
+    def _term(self, word):
+        # A word can become several terms (e.g. "don't" with a Tokenizer), which must all match
+        word = word.strip('"')
+        if self.tokenizer is not None:
+            terms = self.tokenizer.tokens(word)
+        else:
+            terms = [word.lower()] if word else []
+        return self._combine('and', [('term', term) for term in terms])
+
+    def search(self, query):
+        """
+        Return the sorted ids of the documents matching a boolean query.
+        """
+        sequence, key = self._evaluate(self.parse(query))
+        return list(map(key, sequence)) if key else list(sequence)
+
+    def _universe(self):
+        return self.index.doc_ids()
+
+    def _evaluate(self, node):
+        """
+        Evaluate a node into a sorted (sequence, key) pair: either a postings list with
+        doc_id_of as key, or a list of ids with no key.
+        """
+        kind = node[0]
+        if kind == 'term':
+            return self.index.postings(node[1]), doc_id_of
+        if kind == 'not':
+            return subtract(self._universe(), *self._evaluate(node[1])), None
+        if kind == 'or':
+            return union([self._evaluate(child) for child in node[1]]), None
+        return self._evaluate_and(node[1])
+
+    def _evaluate_and(self, children):
+        positive = [self._evaluate(child) for child in children if child[0] != 'not']
+        negative = [self._evaluate(child[1]) for child in children if child[0] == 'not']
+
+        if not positive:
+            positive = [(self._universe(), None)]
+        positive.sort(key=lambda pair: len(pair[0]))  # Shortest list first
+
+        sequence, key = positive[0]
+        result = list(map(key, sequence)) if key else list(sequence)
+        for sequence, key in positive[1:]:
+            if not result:
+                break
+            result = intersect(result, sequence, key)
+        for sequence, key in negative:
+            if not result:
+                break
+            result = subtract(result, sequence, key)
+        return result, None
@@ -0,0 +1,270 @@
+"""
+Group documents by topic with mini-batch spherical k-means.
+
+Documents are turned into term count vectors divided by their magnitude, so the dot
+product of two of them is their cosine similarity (VectorCompare.relation). k-means
+keeps k centroid vectors, also of magnitude 1, and assigns every document to the
+centroid it is most similar to.
+
+Instead of going over the whole corpus for every update, mini-batch k-means (Sculley,
+"Web-Scale K-Means Clustering", 2010) reads the documents in batches:
+
+    1. The documents of the batch are assigned to their most similar centroid, with
+       one sparse (batch x vocabulary) by dense (vocabulary x k) matrix product.
+    2. Every centroid moves towards the mean of its new documents, by a step of
+       (documents of the batch) / (documents assigned to it so far), so centroids
+       settle down as they see more documents.
+    3. The centroids are divided by their magnitude again ("spherical" k-means).
+
+Each batch costs time proportional to its size, so a pass over the corpus is linear,
+and batches can be streamed from disk without holding the corpus in memory. The
+centroids are dense (k x vocabulary float32), which is what limits k and the vocabulary.
+
+Requires numpy and scipy.
+"""
+
+import math
+import os
+from itertools import islice
+
+import numpy as np
+from scipy import sparse
+
+
+class SphericalKMeans:
+    """
+    Mini-batch spherical k-means over a fixed vocabulary.
+
+    Args:
+        vocabulary (iterable): The terms that are used as dimensions, for example the
+            terms of an index. Other words are ignored.
+        k (int): Number of clusters.
+        batch_size (int): Documents per batch.
+        seed (int): Seed of the random choice of the first centroids.
+        term_weights (sequence): Optional weight of every vocabulary term (such as its
+            idf) that counts are multiplied by, so frequent words do not decide the
+            clusters.
+
+    Raises:
+        ValueError: If k is not positive.
+    """
+
+    def __init__(self, vocabulary, k=10, batch_size=1000, seed=0, term_weights=None):
+        if k <= 0:
+            raise ValueError('k should be positive')
+        self.terms = list(vocabulary)
+        self.vocabulary = {term: column for column, term in enumerate(self.terms)}
+        self.term_weights = None
+        if term_weights is not None:
+            self.term_weights = np.asarray(term_weights, dtype=np.float32)
+            if self.term_weights.shape != (len(self.terms),):
+                raise ValueError('Expected one weight per vocabulary term')
+        self.k = k
+        self.batch_size = batch_size
+        self.random = np.random.default_rng(seed)
+        self.centroids = None  # k x vocabulary, rows of magnitude 1 once initialized
+        self.counts = np.zeros(k, dtype=np.int64)  # Documents assigned to each centroid so far
+
+    def vectors(self, concordances):
+        """
+        Return a CSR matrix of the concordances over the vocabulary, rows divided by
+        their magnitude. Documents without any vocabulary term give empty rows.
+        """
+        indptr = [0]
+        indices = []
+        data = []
+        for concordance in concordances:
+            for word, count in concordance.items():
+                column = self.vocabulary.get(word)
+                if column is not None:
+                    indices.append(column)
+                    data.append(count)
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, len(self.terms)))
+        if self.term_weights is not None:
+            matrix.data *= self.term_weights[matrix.indices]
+        magnitudes = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        inverse = np.divide(1.0, magnitudes, out=np.zeros_like(magnitudes), where=magnitudes > 0)
+        return sparse.diags(inverse.astype(np.float32)) @ matrix
+
+    def _initialize(self, vectors):
+        """
+        Start from k different non-empty documents of the first batch.
+        """
+        rows = np.flatnonzero(np.diff(vectors.indptr))
+        if len(rows) < self.k:
+            raise ValueError('The first batch should hold at least k = {} non-empty documents'.format(self.k))
+        chosen = self.random.choice(rows, size=self.k, replace=False)
+        self.centroids = vectors[chosen].toarray()
+
+    def _assign(self, vectors):
+        """
+        Return the closest centroid of every row and the similarity to it, with -1 and
+        0 for empty rows.
+        """
+        if self.centroids is None:
+            raise ValueError('The model has not been fitted')
+        similarities = np.asarray(vectors @ self.centroids.T)
+        clusters = similarities.argmax(axis=1)
+        best = similarities[np.arange(len(clusters)), clusters]
+        empty = np.diff(vectors.indptr) == 0
+        clusters[empty] = -1
+        best[empty] = 0
+        return clusters, best
+
+    def partial_fit(self, concordances):
+        """
+        Update the centroids with one batch of documents.
+        """
+        vectors = self.vectors(concordances)
+        if self.centroids is None:
+            self._initialize(vectors)
+
+        clusters, _ = self._assign(vectors)
+        assigned = clusters >= 0
+        members = sparse.csr_matrix(
+            (np.ones(assigned.sum(), dtype=np.float32), (clusters[assigned], np.flatnonzero(assigned))),
+            shape=(self.k, vectors.shape[0]))
+        batch_counts = np.asarray(members.sum(axis=1)).ravel().astype(np.int64)
+        sums = np.asarray((members @ vectors).todense())  # Sum of the new documents of every centroid
+
+        self.counts += batch_counts
+        updated = batch_counts > 0
+        rates = batch_counts[updated] / self.counts[updated]
+        means = sums[updated] / batch_counts[updated, None]
+        self.centroids[updated] = (1 - rates[:, None]) * self.centroids[updated] + rates[:, None] * means
+        norms = np.linalg.norm(self.centroids[updated], axis=1, keepdims=True)
+        self.centroids[updated] /= np.where(norms > 0, norms, 1)
+        return self
+
+    def fit(self, concordances, epochs=1):
+        """
+        Run mini-batch k-means over a corpus.
+
+        Args:
+            concordances: An iterable of concordances, or a function returning a new
+                iterable of them for every epoch, so a corpus on disk can be read again
+                without being kept in memory.
+            epochs (int): Number of passes over the corpus.
+        """
+        for _ in range(epochs):
+            stream = concordances() if callable(concordances) else concordances
+            for batch in _batches(stream, self.batch_size):
+                self.partial_fit(batch)
+        return self
+
+    def predict(self, concordances):
+        """
+        Assign documents to clusters, batch by batch.
+
+        Returns:
+            tuple: (clusters, similarities) numpy arrays, in the order of the documents.
+            Documents without any vocabulary term get cluster -1.
+        """
+        clusters = []
+        similarities = []
+        for batch in _batches(concordances, self.batch_size):
+            batch_clusters, batch_similarities = self._assign(self.vectors(batch))
+            clusters.append(batch_clusters)
+            similarities.append(batch_similarities)
+        if not clusters:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(clusters), np.concatenate(similarities)
+
+    def top_terms(self, cluster, count=10):
+        """
+        Return the terms with the highest weight in a centroid, to describe the cluster.
+        """
+        weights = self.centroids[cluster]
+        best = np.argsort(-weights, kind='stable')[:count]
+        return [self.terms[column] for column in best if weights[column] > 0]
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def save_clusters(directory, clusters, centroids):
+    """
+    Write cluster assignments next to an index:
+
+        clusters.bin   the cluster of every document id (little-endian int32, -1 for none)
+        centroids.npy  the centroids, columns in the sorted order of the index terms
+    """
+    np.asarray(clusters, dtype='<i4').tofile(os.path.join(directory, 'clusters.bin'))
+    np.save(os.path.join(directory, 'centroids.npy'), centroids)
+
+
+def load_clusters(directory):
+    """
+    Read the files written by save_clusters.
+
+    Returns:
+        tuple: (clusters, centroids) numpy arrays. clusters is memory-mapped.
+    """
+    clusters = np.memmap(os.path.join(directory, 'clusters.bin'), dtype='<i4', mode='r')
+    return clusters, np.load(os.path.join(directory, 'centroids.npy'))
+
+
+def cluster_index(corpus, index_dir, k=10, epochs=2, batch_size=1000, tokenizer=None, seed=0):
+    """
+    Cluster the documents of an index built by indexer.py from a corpus, and save the
+    assignments in the index directory.
+
+    The corpus is streamed from disk epochs + 1 times (to fit, then to assign), in the
+    order the indexer read it, so the n-th document gets doc id n. Counts are weighted
+    by the idf of the terms in the index.
+
+    Returns:
+        SphericalKMeans: The fitted model.
+    """
+    from index_format import MappedIndex
+    from indexer import read_documents
+    from vector_compare import VectorCompare
+
+    index = MappedIndex(index_dir)
+    try:
+        vocabulary = list(index.terms())  # Already sorted
+        idf = [math.log(len(index) / index.document_frequency(term)) for term in vocabulary]
+    finally:
+        index.close()
+
+    vector_compare = VectorCompare(tokenizer)
+
+    def concordances():
+        return (vector_compare.concordance(text.lower()) for _, text in read_documents(corpus))
+
+    model = SphericalKMeans(vocabulary, k, batch_size, seed, idf).fit(concordances, epochs)
+    clusters, _ = model.predict(concordances())
+    save_clusters(index_dir, clusters, model.centroids)
+    return model
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from tokenizer import TOKENIZER_NAMES, make_tokenizer
+
+    parser = argparse.ArgumentParser(description='Cluster the documents of an index written by indexer.py.')
+    parser.add_argument('corpus', help='the directory of documents or JSONL file that was indexed')
+    parser.add_argument('index_dir', help='where clusters.bin and centroids.npy are written')
+    parser.add_argument('-k', type=int, default=10, help='number of clusters')
+    parser.add_argument('--epochs', type=int, default=2, help='passes over the corpus')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--tokenizer', choices=TOKENIZER_NAMES, default='whitespace',
+                        help='must match the tokenizer the index was built with')
+    args = parser.parse_args()
+
+    model = cluster_index(args.corpus, args.index_dir, args.k, args.epochs, args.batch_size,
+                          make_tokenizer(args.tokenizer))
+    clusters, _ = load_clusters(args.index_dir)
+    sizes = np.bincount(clusters[clusters >= 0], minlength=args.k)
+    for cluster in range(args.k):
+        print('{:3} {:7} documents  {}'.format(cluster, sizes[cluster], ' '.join(model.top_terms(cluster))))
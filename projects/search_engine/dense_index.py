@@ -0,0 +1,199 @@
+"""
+Dense vector index: concordances squeezed into a fixed number of dimensions.
+
+A concordance has one entry per distinct word, so with a large vocabulary the dict
+vectors of VectorCompare take a lot of memory. Random projection maps every
+concordance to a vector of a fixed size: each word gets a random Gaussian vector,
+and a document is the sum of the vectors of its words weighted by their counts. The
+angle between two projected documents stays close to the angle between their
+concordances (Johnson-Lindenstrauss), so cosine similarities are roughly preserved.
+
+Two storage modes are available:
+
+    float32  The projected vectors, normalized, in one contiguous (documents x
+             dimensions) array. A search is one matrix-vector product.
+    simhash  Only the sign of each dimension, packed 8 per byte: 256 dimensions take
+             32 bytes per document. The fraction of differing bits (the Hamming
+             distance) between two documents estimates their angle, so the cosine is
+             estimated as cos(pi * hamming / dimensions). Hamming distances are
+             computed with XOR and popcount over the whole array at once.
+
+Requires numpy.
+"""
+
+import math
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+
+MODES = ('float32', 'simhash')
+
+if hasattr(np, 'bitwise_count'):
+    popcount = np.bitwise_count  # numpy 2.0 and later
+else:
+    _POPCOUNT_TABLE = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+    def popcount(array):
+        return _POPCOUNT_TABLE[array]
+
+
+def word_vector(word, dimensions, seed):
+    """
+    Return the random vector of a word.
+
+    It is generated from a hash of the word rather than stored, so the projection needs
+    no memory per vocabulary word.
+    """
+    generator = np.random.default_rng([seed, zlib.crc32(word.encode('utf-8'))])
+    return generator.standard_normal(dimensions, dtype=np.float32)
+
+
+class DenseVectorIndex:
+    """
+    An index of randomly projected document vectors.
+
+    Args:
+        dimensions (int): Size of the projected vectors. In simhash mode it must be a
+            multiple of 8.
+        mode (str): 'float32' or 'simhash'.
+        seed (int): Seed of the word vectors. Vectors are only comparable between
+            indexes built with the same seed and dimensions.
+        cache_size (int): Number of word vectors kept (least recently used dropped) so
+            frequent words are not generated again. Each takes 4 * dimensions bytes,
+            counted by nbytes(); 0 generates every vector when it is needed.
+
+    Raises:
+        ValueError: If the mode is unknown or the dimensions do not fit the mode.
+    """
+
+    def __init__(self, dimensions=256, mode='float32', seed=1, cache_size=1024):
+        if mode not in MODES:
+            raise ValueError('Unknown mode {!r}, expected one of {}'.format(mode, ', '.join(MODES)))
+        if mode == 'simhash' and dimensions % 8:
+            raise ValueError('simhash dimensions should be a multiple of 8')
+        self.dimensions = dimensions
+        self.mode = mode
+        self.seed = seed
+        self.word_vector = lru_cache(maxsize=cache_size)(self._word_vector)
+
+        width = dimensions if mode == 'float32' else dimensions // 8
+        self.vectors = np.zeros((16, width), dtype=np.float32 if mode == 'float32' else np.uint8)
+        self.doc_ids = []
+        self.count = 0  # Rows of self.vectors in use; the rest is room to grow
+
+    def __len__(self):
+        return self.count
+
+    def _word_vector(self, word):
+        return word_vector(word, self.dimensions, self.seed)
+
+    def project(self, concordance):
+        """
+        Return the normalized random projection of a concordance as a float32 vector.
+        """
+        if not concordance:
+            return np.zeros(self.dimensions, dtype=np.float32)
+        word_vectors = np.stack([self.word_vector(word) for word in concordance])
+        vector = np.fromiter(concordance.values(), dtype=np.float32, count=len(concordance)) @ word_vectors
+        magnitude = np.linalg.norm(vector)
+        return vector / magnitude if magnitude > 0 else vector
+
+    def _encode(self, concordance):
+        vector = self.project(concordance)
+        if self.mode == 'float32':
+            return vector
+        return np.packbits(vector > 0)
+
+    def add_document(self, doc_id, concordance):
+        """
+        Add a document.
+
+        Args:
+            doc_id: Identifier of the document.
+            concordance (dict): A dictionary with words as keys and their counts as values.
+        """
+        if self.count == len(self.vectors):
+            # Double the capacity, so adding n documents copies O(n) rows in total
+            grown = np.zeros((2 * len(self.vectors), self.vectors.shape[1]), dtype=self.vectors.dtype)
+            grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+        self.vectors[self.count] = self._encode(concordance)
+        self.doc_ids.append(doc_id)
+        self.count += 1
+
+    def nbytes(self):
+        """
+        Return the number of bytes taken by the vectors of the indexed documents and the
+        cached word vectors.
+        """
+        cached = self.word_vector.cache_info().currsize * self.dimensions * np.dtype(np.float32).itemsize
+        return self.count * self.vectors.shape[1] * self.vectors.itemsize + cached
+
+    def scores(self, query_concordance):
+        """
+        Return the (estimated) cosine similarity of the query with every document.
+        """
+        vectors = self.vectors[:self.count]
+        query = self._encode(query_concordance)
+        if self.mode == 'float32':
+            return vectors @ query
+        hamming = popcount(vectors ^ query).sum(axis=1, dtype=np.int64)
+        return np.cos(math.pi * hamming / self.dimensions)
+
+    def search(self, query_concordance, k=10):
+        """
+        Return the k documents most similar to the query.
+
+        Returns:
+            list: Up to k (estimated cosine similarity, doc_id) tuples sorted by descending score.
+        """
+        if k <= 0 or self.count == 0 or not query_concordance:
+            return []
+        scores = self.scores(query_concordance)
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(float(scores[i]), self.doc_ids[i]) for i in best]
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+
+    from benchmark import zipf_concordances
+    from inverted_index import InvertedIndex
+
+    # A synthetic corpus with a large vocabulary whose word frequencies follow Zipf's law
+    concordances = zipf_concordances(3000, 50000, max_length=300)
+    random.seed(0)
+    # Projections are most accurate for long vectors, so the queries are documents too:
+    # "find documents like this one"
+    queries = [concordances[doc_id] for doc_id in random.sample(range(len(concordances)), 50)]
+
+    print('Concordance dicts: {:.2f} MB'.format(sum(
+        sys.getsizeof(concordance) + sum(sys.getsizeof(word) for word in concordance)
+        for concordance in concordances.values()) / 1e6))
+    exact = InvertedIndex()
+    for doc_id, concordance in concordances.items():
+        exact.add_document(doc_id, concordance)
+    expected = [{doc_id for _, doc_id in exact.search(query, k=10)} for query in queries]
+
+    for mode, dimensions in (('float32', 256), ('simhash', 256), ('simhash', 1024)):
+        index = DenseVectorIndex(dimensions, mode)
+        for doc_id, concordance in concordances.items():
+            index.add_document(doc_id, concordance)
+        start = time.perf_counter()
+        found = [[doc_id for _, doc_id in index.search(query, k=100)] for query in queries]
+        seconds = (time.perf_counter() - start) / len(queries)
+        # How many of the exact 10 best are in the approximate 10 and 100 best
+        recall_10 = sum(len(e.intersection(f[:10])) for f, e in zip(found, expected)) / (10 * len(queries))
+        recall_100 = sum(len(e.intersection(f)) for f, e in zip(found, expected)) / (10 * len(queries))
+        cached = index.word_vector.cache_info().currsize * dimensions * 4
+        print('{:<8} {:>5} dimensions: {:6.2f} MB ({:.2f} MB of cached word vectors)  {:6.2f} ms/query  '
+              'recall@10 {:.2f}  in top 100 {:.2f}'.format(
+                  mode, dimensions, index.nbytes() / 1e6, cached / 1e6, seconds * 1000, recall_10, recall_100))
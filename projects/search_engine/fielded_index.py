@@ -0,0 +1,182 @@
+"""
+Documents with several fields (title, body, tags), scored with a weight per field.
+
+Every field has its own postings and statistics (norms, lengths, maximum weights), kept
+in an InvertedIndex per field, so a word in a title is scored against other titles: a
+two-word title containing the query word is a strong match, while the same word once
+in a long body is not. A search walks the postings lists of every (field, query term)
+pair together in doc id order, so the weighted sum
+
+    score(document) = sum over fields of weight(field) * score of the field
+
+is computed in one pass, with one heap of the best k documents, rather than by searching
+each field separately and merging the result lists.
+"""
+
+import heapq
+
+from inverted_index import DEFAULT_SCORER, InvertedIndex
+from vector_compare import DocumentVector, VectorCompare
+
+
+DEFAULT_FIELD_WEIGHTS = {'title': 3.0, 'body': 1.0, 'tags': 2.0}
+
+
+class FieldedIndex:
+    """
+    An index of documents made of named text fields.
+
+    Args:
+        field_weights (dict): field name -> weight of its score. The keys are the fields
+            documents may have.
+        tokenizer (Tokenizer): Splits fields into terms. Without one, lowercased text is
+            split on whitespace, like VectorCompare.concordance.
+    """
+
+    def __init__(self, field_weights=None, tokenizer=None):
+        self.field_weights = dict(field_weights or DEFAULT_FIELD_WEIGHTS)
+        self.vector_compare = VectorCompare(tokenizer)
+        self.fields = {field: InvertedIndex() for field in self.field_weights}
+        self.documents = {}  # doc_id -> {field: text}, to show results
+
+    def __len__(self):
+        return len(self.documents)
+
+    def concordance(self, text):
+        """
+        Return the concordance of a field. Lists (such as tags) are joined with spaces.
+        """
+        if not isinstance(text, str):
+            text = ' '.join(text)
+        return DocumentVector(self.vector_compare.concordance(text.lower()))
+
+    def add_document(self, doc_id, fields):
+        """
+        Add a document.
+
+        Args:
+            doc_id (int): Identifier of the document. Ids must be added in increasing order.
+            fields (dict): field name -> text (or list of strings). Missing fields are empty.
+
+        Raises:
+            ValueError: If the document id is already indexed, not larger than the ids
+                added before it, or a field is unknown.
+        """
+        if doc_id in self.documents:
+            raise ValueError('Document {} is already indexed'.format(doc_id))
+        self._check_fields(fields)
+
+        # Every field index gets every document, even with an empty field, so that they
+        # all count the same number of documents for idf and average lengths
+        for field, index in self.fields.items():
+            index.add_document(doc_id, self.concordance(fields.get(field, '')))
+        self.documents[doc_id] = dict(fields)
+
+    def _check_fields(self, fields):
+        unknown = set(fields) - set(self.fields)
+        if unknown:
+            raise ValueError('Unknown fields {}, expected some of {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(self.fields)))
+
+    def document(self, doc_id):
+        return self.documents[doc_id]
+
+    def search(self, query_concordance, k=10, scorer=None, field_weights=None):
+        """
+        Return the k documents whose weighted field scores add up highest.
+
+        Args:
+            query_concordance (dict): Concordance of the query.
+            k (int): Number of results to return.
+            scorer: A scorer from scoring.py, applied to every field.
+            field_weights (dict): Weights to use instead of the index's for this query.
+                Fields left out (or with weight 0) are not searched.
+
+        Returns:
+            list: Up to k (score, doc_id) tuples sorted by descending score.
+
+        Raises:
+            ValueError: If field_weights holds an unknown field.
+        """
+        if field_weights is None:
+            field_weights = self.field_weights
+        self._check_fields(field_weights)
+        if k <= 0:
+            return []
+        if scorer is None:
+            scorer = DEFAULT_SCORER
+
+        # One cursor per (field, query term): (index, field weight * query weight, postings)
+        cursors = []
+        for field, field_weight in field_weights.items():
+            index = self.fields[field]
+            if field_weight <= 0:
+                continue
+            for word, weight in scorer.query_weights(index, query_concordance).items():
+                postings = index.postings(word)
+                if postings and weight > 0:
+                    cursors.append((index, field_weight * weight, postings))
+
+        # Merge the postings lists in doc id order, scoring each document once all of its
+        # postings have been seen
+        streams = [_numbered(postings, number) for number, (_, _, postings) in enumerate(cursors)]
+        heap = []
+        doc_id = None
+        score = 0
+        factors = {}  # index -> document factor of the current document
+        for next_doc_id, count, number in heapq.merge(*streams):
+            if next_doc_id != doc_id:
+                if doc_id is not None:
+                    _push(heap, k, score, doc_id)
+                doc_id = next_doc_id
+                score = 0
+                factors = {}
+            index, weight, _ = cursors[number]
+            factor = factors.get(index)
+            if factor is None:
+                factor = factors[index] = scorer.document_factor(index, index, doc_id)
+            score += weight * scorer.term_weight(count, factor)
+        if doc_id is not None:
+            _push(heap, k, score, doc_id)
+
+        return sorted(heap, reverse=True)
+
+
+def _numbered(postings, number):
+    """
+    Yield the postings of a list as (doc_id, count, number of the list) tuples.
+    """
+    for doc_id, count in postings:
+        yield doc_id, count, number
+
+
+def _push(heap, k, score, doc_id):
+    """
+    Keep (score, doc_id) in a min-heap of the best k documents.
+    """
+    if len(heap) < k:
+        heapq.heappush(heap, (score, doc_id))
+    elif score > heap[0][0]:
+        heapq.heapreplace(heap, (score, doc_id))
+
+
+if __name__ == "__main__":
+    from scoring import SCORERS
+    from vector_compare import documents
+
+    titles = [
+        'At Scale You Will Hit Every Performance Issue',
+        'Richard Stallman to visit Australia',
+        'MySQL Backups Done Easily',
+        'Why You Shouldnt roll your own CAPTCHA',
+        'The Great Benefit of Test Driven Development Nobody Talks About',
+        'Setting up GIT to use a Subversion SVN style workflow',
+        'Why CAPTCHA Never Use Numbers 0 1 5 7',
+    ]
+    index = FieldedIndex()
+    for doc_id, title in enumerate(titles):
+        index.add_document(doc_id, {'title': title, 'body': documents[doc_id][len(title):]})
+
+    query = VectorCompare().query_vector('captcha numbers')
+    for score, doc_id in index.search(query, k=3, scorer=SCORERS['bm25']):
+        print('{:.3f}  {}'.format(score, index.document(doc_id)['title']))
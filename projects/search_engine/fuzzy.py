@@ -0,0 +1,200 @@
+"""
+Fuzzy term lookup, for misspelled query words.
+
+A misspelled word matches no postings. FuzzyExpander finds the terms of the index within
+a small edit distance of it (insertions, deletions, substitutions and swaps of two
+adjacent letters), to correct or expand the query.
+
+Comparing the word with every term of the vocabulary would cost one edit distance per
+term. Instead the vocabulary is stored in a trie (terms sharing a prefix share a path
+of nodes), and the rows of the edit distance table are computed while walking it: the
+row of a node is computed once from the row of its parent and shared by every term below
+it. As soon as every value of a row is larger than the maximum distance, no term below
+that node can be close enough and the whole subtree is skipped, so only a small part of
+the trie is visited.
+"""
+
+TERM = None  # Key of a trie node holding the term that ends at this node
+
+
+class TermTrie:
+    """
+    A trie of terms, searched by edit distance.
+    """
+
+    def __init__(self, terms=()):
+        self.root = {}
+        self.size = 0
+        for term in terms:
+            self.add(term)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, term):
+        node = self.root
+        for char in term:
+            node = node.setdefault(char, {})
+        if TERM not in node:
+            node[TERM] = term
+            self.size += 1
+
+    def __contains__(self, term):
+        node = self.root
+        for char in term:
+            node = node.get(char)
+            if node is None:
+                return False
+        return TERM in node
+
+    def search(self, word, max_distance=2):
+        """
+        Find the terms within max_distance edits of a word.
+
+        Returns:
+            list: (distance, term) tuples, closest first.
+        """
+        results = []
+        first_row = list(range(len(word) + 1))
+        for char, child in self.root.items():
+            if char is not TERM:
+                self._search(child, char, None, first_row, None, word, max_distance, results)
+        results.sort()
+        return results
+
+    def _search(self, node, char, previous_char, row, previous_row, word, max_distance, results):
+        """
+        Compute the row of the edit distance table for the path ending with char, record
+        the term of the node if it is close enough, and walk the children while some
+        value of the row is small enough.
+
+        Rows are those of the optimal string alignment distance: Levenshtein plus swaps of
+        adjacent letters, which needs the row before the previous one.
+        """
+        current = [row[0] + 1]
+        for column in range(1, len(word) + 1):
+            cost = min(
+                current[column - 1] + 1,  # Insertion
+                row[column] + 1,  # Deletion
+                row[column - 1] + (word[column - 1] != char),  # Substitution
+            )
+            if (previous_row is not None and column > 1
+                    and char == word[column - 2] and previous_char == word[column - 1]):
+                cost = min(cost, previous_row[column - 2] + 1)  # Swap
+            current.append(cost)
+
+        if TERM in node and current[-1] <= max_distance:
+            results.append((current[-1], node[TERM]))
+        if min(current) <= max_distance:
+            for next_char, child in node.items():
+                if next_char is not TERM:
+                    self._search(child, next_char, char, current, row, word, max_distance, results)
+
+
+def edit_distance(word1, word2):
+    """
+    Optimal string alignment distance between two words, computed directly. Used to
+    check TermTrie.search.
+    """
+    previous_row = None
+    row = list(range(len(word2) + 1))
+    for i in range(1, len(word1) + 1):
+        current = [i]
+        for j in range(1, len(word2) + 1):
+            cost = min(current[j - 1] + 1, row[j] + 1, row[j - 1] + (word1[i - 1] != word2[j - 1]))
+            if (previous_row is not None and j > 1
+                    and word1[i - 1] == word2[j - 2] and word1[i - 2] == word2[j - 1]):
+                cost = min(cost, previous_row[j - 2] + 1)
+            current.append(cost)
+        previous_row, row = row, current
+    return row[-1]
+
+
+class FuzzyExpander:
+    """
+    Correct and expand query terms with the vocabulary of an index.
+
+    Args:
+        index: An InvertedIndex, MappedIndex or anything with terms() and
+            document_frequency(term).
+        max_distance (int): Largest number of edits between a word and its corrections.
+    """
+
+    def __init__(self, index, max_distance=2):
+        self.index = index
+        self.max_distance = max_distance
+        self.trie = TermTrie(index.terms())
+
+    def candidates(self, word, max_distance=None):
+        """
+        Return the terms close to a word, closest first, then most frequent first.
+
+        Returns:
+            list: (distance, term) tuples.
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        matches = self.trie.search(word, max_distance)
+        return sorted(matches, key=lambda match: (match[0], -self.index.document_frequency(match[1]), match[1]))
+
+    def correct(self, word):
+        """
+        Return the word if the index knows it, otherwise its best correction, or None.
+        """
+        if word in self.trie:
+            return word
+        candidates = self.candidates(word)
+        return candidates[0][1] if candidates else None
+
+    def expand_query(self, query_concordance, max_expansions=3):
+        """
+        Replace the words of a query that the index does not know by up to
+        max_expansions of their closest terms, with the same count. Known words are kept
+        as they are; words without any close term are dropped.
+
+        Returns:
+            dict: The expanded query concordance.
+        """
+        expanded = {}
+        for word, count in query_concordance.items():
+            if word in self.trie:
+                terms = [word]
+            else:
+                terms = [term for _, term in self.candidates(word)[:max_expansions]]
+            for term in terms:
+                expanded[term] = expanded.get(term, 0) + count
+        return expanded
+
+
+if __name__ == "__main__":
+    import random
+    import string
+    import time
+
+    from inverted_index import InvertedIndex
+    from vector_compare import VectorCompare, documents
+
+    v = VectorCompare()
+    index = InvertedIndex()
+    for doc_id, text in documents.items():
+        index.add_document(doc_id, v.concordance(text.lower()))
+    expander = FuzzyExpander(index)
+    query = v.query_vector('captcah nmbers mysql')
+    print(dict(query), '->', expander.expand_query(query, max_expansions=1))
+
+    # Trie search against comparing the word with every term of a large vocabulary
+    random.seed(0)
+    vocabulary = {''.join(random.choices(string.ascii_lowercase, k=random.randint(4, 12))) for _ in range(100000)}
+    trie = TermTrie(vocabulary)
+    words = random.sample(sorted(vocabulary), 5)
+    words = [word[:2] + word[3:] for word in words]  # Drop a letter
+
+    start = time.perf_counter()
+    found = [trie.search(word, 2) for word in words]
+    trie_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = [sorted((d, term) for term in vocabulary if (d := edit_distance(word, term)) <= 2) for word in words]
+    loop_seconds = time.perf_counter() - start
+    assert found == expected
+    print('{} terms: trie {:.1f} ms per word, loop over every term {:.1f} ms per word'.format(
+        len(vocabulary), trie_seconds / len(words) * 1000, loop_seconds / len(words) * 1000))
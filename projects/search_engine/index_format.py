@@ -0,0 +1,282 @@
+"""
+Binary index format
+
+An index directory holds four files:
+
+    terms.bin     header (magic, version, term count, document count, total length)
+                  followed by one fixed-size entry per term, sorted by term:
+                  (term offset, term length, postings offset, postings length,
+                   document frequency, upper bound, largest count, log upper bound)
+    lexicon.bin   the UTF-8 bytes of every term, one after the other
+    postings.bin  for every term, its postings as varints: the gap between a document
+                  id and the previous one, then the count
+    norms.bin     per document id: magnitude and log magnitude (little-endian float64)
+                  and length (uint32)
+
+The document count, total length and per-document statistics are the collection
+statistics used by the scorers of scoring.py, so TF-IDF and BM25 need nothing but
+the index files.
+
+Because the term entries have a fixed size, a term is found with a binary search
+directly in the memory-mapped file, and nothing has to be loaded before the first query.
+"""
+
+import mmap
+import os
+import struct
+from array import array
+
+from inverted_index import InvertedIndex
+from scoring import log_weight
+
+
+MAGIC = b'VSIX'
+VERSION = 2
+HEADER = struct.Struct('<4sIQQQ')  # magic, version, term count, document count, total length
+TERM_ENTRY = struct.Struct('<QIQIIdId')
+DOCUMENT = struct.Struct('<ddI')  # magnitude, log magnitude, length
+
+
+def encode_varint(value, out):
+    """
+    Append a non-negative integer to a bytearray using 7 bits per byte.
+
+    The high bit of every byte says whether more bytes follow, so small numbers (like
+    the gaps between sorted document ids) take a single byte.
+    """
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buffer, position):
+    """
+    Read an integer written by encode_varint.
+
+    Returns:
+        tuple: (value, position of the next byte).
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def encode_postings(postings):
+    """
+    Encode a list of (doc_id, count) tuples sorted by doc_id.
+    """
+    out = bytearray()
+    previous = 0
+    for doc_id, count in postings:
+        encode_varint(doc_id - previous, out)
+        encode_varint(count, out)
+        previous = doc_id
+    return out
+
+
+def decode_postings(buffer, start=0, end=None):
+    """
+    Decode the postings written by encode_postings.
+    """
+    if end is None:
+        end = len(buffer)
+    postings = []
+    doc_id = 0
+    position = start
+    while position < end:
+        gap, position = decode_varint(buffer, position)
+        count, position = decode_varint(buffer, position)
+        doc_id += gap
+        postings.append((doc_id, count))
+    return postings
+
+
+def write_index(directory, postings_lists, documents):
+    """
+    Write an index in the binary format.
+
+    Everything is streamed, so this works for indexes larger than memory.
+
+    Args:
+        directory (str): Where to write the files.
+        postings_lists (iterable): (term, postings) tuples sorted by term, where postings
+            is a list of (doc_id, count) tuples sorted by doc_id.
+        documents (iterable): (magnitude, log magnitude, length) of every document, in
+            doc id order starting at 0.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    norms = array('d')
+    log_norms = array('d')
+    total_length = 0
+    with open(os.path.join(directory, 'norms.bin'), 'wb') as norms_file:
+        for magnitude, document_log_magnitude, length in documents:
+            norms_file.write(DOCUMENT.pack(magnitude, document_log_magnitude, length))
+            norms.append(magnitude)
+            log_norms.append(document_log_magnitude)
+            total_length += length
+
+    with open(os.path.join(directory, 'terms.bin'), 'wb') as terms_file, \
+            open(os.path.join(directory, 'lexicon.bin'), 'wb') as lexicon_file, \
+            open(os.path.join(directory, 'postings.bin'), 'wb') as postings_file:
+        terms_file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))  # The header is filled in at the end
+        term_count = 0
+        lexicon_offset = 0
+        postings_offset = 0
+        for term, postings in postings_lists:
+            term_bytes = term.encode('utf-8')
+            encoded = encode_postings(postings)
+            upper_bound = max(count / norms[doc_id] for doc_id, count in postings)
+            log_upper_bound = max(log_weight(count) / log_norms[doc_id] for doc_id, count in postings)
+            max_count = max(count for _, count in postings)
+            terms_file.write(TERM_ENTRY.pack(
+                lexicon_offset, len(term_bytes), postings_offset, len(encoded), len(postings),
+                upper_bound, max_count, log_upper_bound))
+            lexicon_file.write(term_bytes)
+            postings_file.write(encoded)
+            lexicon_offset += len(term_bytes)
+            postings_offset += len(encoded)
+            term_count += 1
+
+        terms_file.seek(0)
+        terms_file.write(HEADER.pack(MAGIC, VERSION, term_count, len(norms), total_length))
+
+
+def save_index(index, directory):
+    """
+    Write an InvertedIndex in the binary format. Document ids must be non-negative integers.
+    """
+    documents = [(0.0, 0.0, 0)] * (max(index.norms) + 1 if index.norms else 0)
+    for doc_id in index.norms:
+        documents[doc_id] = (index.norm(doc_id), index.log_norm(doc_id), index.length(doc_id))
+    write_index(directory, sorted(index.postings_lists.items()), documents)
+
+
+def _map(path):
+    """
+    Memory-map a file for reading. Empty files cannot be mapped and become empty bytes.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class MappedIndex(InvertedIndex):
+    """
+    A read-only InvertedIndex backed by memory-mapped files in the binary format.
+
+    Opening the index only maps the files, so it takes milliseconds whatever the index
+    size, and the operating system loads pages as queries touch them. Several processes
+    opening the same index share those pages instead of each holding its own copy.
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.terms_map = _map(os.path.join(directory, 'terms.bin'))
+        self.lexicon_map = _map(os.path.join(directory, 'lexicon.bin'))
+        self.postings_map = _map(os.path.join(directory, 'postings.bin'))
+        self.norms_map = _map(os.path.join(directory, 'norms.bin'))
+
+        magic, version, self.term_count, self.doc_count, self.total_length = HEADER.unpack_from(self.terms_map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} index'.format(directory, VERSION))
+
+    def _term_at(self, number):
+        """
+        Return the term bytes and entry of the term at a position of the sorted table.
+        """
+        entry = TERM_ENTRY.unpack_from(self.terms_map, HEADER.size + number * TERM_ENTRY.size)
+        term_offset, term_length = entry[0], entry[1]
+        return self.lexicon_map[term_offset:term_offset + term_length], entry
+
+    def _lookup(self, term):
+        """
+        Binary search the term table. Returns the entry of the term or None.
+        """
+        term_bytes = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            found, entry = self._term_at(middle)
+            if found == term_bytes:
+                return entry
+            if found < term_bytes:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def add_document(self, doc_id, concordance):
+        raise ValueError('A MappedIndex is read-only')
+
+    def terms(self):
+        """
+        Iterate over every term of the index in sorted order.
+        """
+        for number in range(self.term_count):
+            yield self._term_at(number)[0].decode('utf-8')
+
+    def doc_ids(self):
+        return range(self.doc_count)
+
+    def postings(self, term):
+        entry = self._lookup(term)
+        if entry is None:
+            return []
+        postings_offset, postings_length = entry[2], entry[3]
+        return decode_postings(self.postings_map, postings_offset, postings_offset + postings_length)
+
+    def document_frequency(self, term):
+        entry = self._lookup(term)
+        return 0 if entry is None else entry[4]
+
+    def term_upper_bound(self, term):
+        entry = self._lookup(term)
+        return 0 if entry is None else entry[5]
+
+    def term_max_count(self, term):
+        entry = self._lookup(term)
+        return 0 if entry is None else entry[6]
+
+    def term_log_upper_bound(self, term):
+        entry = self._lookup(term)
+        return 0 if entry is None else entry[7]
+
+    def norm(self, doc_id):
+        return DOCUMENT.unpack_from(self.norms_map, doc_id * DOCUMENT.size)[0]
+
+    def log_norm(self, doc_id):
+        return DOCUMENT.unpack_from(self.norms_map, doc_id * DOCUMENT.size)[1]
+
+    def length(self, doc_id):
+        return DOCUMENT.unpack_from(self.norms_map, doc_id * DOCUMENT.size)[2]
+
+    def __len__(self):
+        return self.doc_count
+
+    def close(self):
+        for mapped in (self.terms_map, self.lexicon_map, self.postings_map, self.norms_map):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    from scoring import SCORERS
+    from vector_compare import VectorCompare
+
+    index = MappedIndex(sys.argv[1])
+    v = VectorCompare()
+    scorer = SCORERS[sys.argv[2]]
+    for score, doc_id in index.search(v.query_vector(' '.join(sys.argv[3:])), k=10, scorer=scorer):
+        print(score, doc_id)
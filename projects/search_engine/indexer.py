@@ -0,0 +1,390 @@
+import heapq
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, islice
+
+from index_format import write_index
+from scoring import log_magnitude
+from inverted_index import InvertedIndex
+from tokenizer import TOKENIZER_NAMES, make_tokenizer
+from vector_compare import VectorCompare
+
+
+def read_documents(path):
+    """
+    Stream the documents of a corpus one at a time.
+
+    Args:
+        path (str): Either a directory, where every file is one document, or a JSONL
+            file with one {"id": ..., "text": ...} object per line ("id" is optional).
+
+    Yields:
+        tuple: (source, text), where source is the file name or the "id" of the line.
+    """
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()  # Walk the tree in a stable order so doc ids are reproducible
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                with open(file_path, encoding='utf-8', errors='replace') as file:
+                    yield os.path.relpath(file_path, path), file.read()
+    else:
+        with open(path, encoding='utf-8') as file:
+            for line_number, line in enumerate(file):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                yield record.get('id', line_number), record['text']
+
+
+def write_segment(postings_lists, path):
+    """
+    Write a postings dict to disk, one term per line, sorted by term:
+
+        term<TAB>doc_id:count doc_id:count ...
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        for term in sorted(postings_lists):
+            postings = ' '.join('{}:{}'.format(doc_id, count) for doc_id, count in postings_lists[term])
+            file.write('{}\t{}\n'.format(term, postings))
+
+
+def read_segment(path, segment_number=0):
+    """
+    Stream a segment written by write_segment.
+
+    Yields:
+        tuple: (term, segment_number, postings text), so that lines from several segments
+        can be merged with heapq.merge and still come out in segment order for a term.
+    """
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            term, postings = line.rstrip('\n').split('\t', 1)
+            yield term, segment_number, postings
+
+
+def parse_postings(postings):
+    """
+    Turn 'doc_id:count doc_id:count' back into a list of (doc_id, count) tuples.
+    """
+    result = []
+    for posting in postings.split():
+        doc_id, count = posting.split(':')
+        result.append((int(doc_id), int(count)))
+    return result
+
+
+def read_postings_file(path):
+    """
+    Stream a postings file as (term, postings) tuples.
+    """
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            term, postings = line.rstrip('\n').split('\t', 1)
+            yield term, parse_postings(postings)
+
+
+MERGE_FAN_IN = 64  # Segments merged at once, to stay far below the limit of open files
+
+
+def merge_segments(segment_paths, output_path, fan_in=MERGE_FAN_IN):
+    """
+    Merge sorted segments into a single sorted postings file.
+
+    The segments are read line by line with heapq.merge, so memory use does not depend
+    on their size. Segments hold consecutive ranges of document ids, so appending the
+    postings of a term in segment order keeps them sorted by document id.
+
+    At most fan_in segments are open at once: with more, runs of fan_in consecutive
+    segments are first merged into intermediate segments (which still hold consecutive
+    id ranges), in as many passes as needed. Intermediate segments are deleted once
+    merged; the segments given are left to the caller.
+
+    Raises:
+        ValueError: If fan_in is smaller than 2.
+    """
+    if fan_in < 2:
+        raise ValueError('fan_in should be at least 2')
+    paths = list(segment_paths)
+    merge_pass = 0
+    while len(paths) > fan_in:
+        merged_paths = []
+        for start in range(0, len(paths), fan_in):
+            path = '{}.pass-{}-{:05d}'.format(output_path, merge_pass, len(merged_paths))
+            _merge_files(paths[start:start + fan_in], path)
+            merged_paths.append(path)
+        if merge_pass > 0:
+            for path in paths:
+                os.remove(path)
+        paths = merged_paths
+        merge_pass += 1
+
+    _merge_files(paths, output_path)
+    if merge_pass > 0:
+        for path in paths:
+            os.remove(path)
+
+
+def _merge_files(segment_paths, output_path):
+    streams = [read_segment(path, number) for number, path in enumerate(segment_paths)]
+    with open(output_path, 'w', encoding='utf-8') as file:
+        for term, lines in groupby(heapq.merge(*streams), key=lambda line: line[0]):
+            file.write('{}\t{}\n'.format(term, ' '.join(postings for _, _, postings in lines)))
+
+
+class SpimiIndexer:
+    """
+    Build an index of a corpus too large to fit in memory (Single-Pass In-Memory Indexing).
+
+    Documents are read one at a time and added to an in-memory postings dict. When the
+    dict holds max_postings postings it is written to disk as a sorted "segment" and
+    emptied. At the end all segments are merged into one postings file.
+
+    The output directory contains:
+        postings.txt     term<TAB>doc_id:count ... sorted by term
+        documents.jsonl  one {"id", "source", "magnitude", "log_magnitude", "length", "preview"}
+                         object per document
+        *.bin            the same index in the binary format of index_format.py,
+                         which MappedIndex opens without loading it
+    """
+
+    def __init__(self, output_dir, max_postings=1000000, tokenizer=None):
+        """
+        Args:
+            output_dir (str): Where to write the index.
+            max_postings (int): Postings held in memory before a segment is written.
+            tokenizer (Tokenizer): Tokenizer used to build concordances; queries must be
+                tokenized the same way. None splits lowercased text on whitespace.
+        """
+        self.output_dir = output_dir
+        self.max_postings = max_postings
+        self.tokenizer = tokenizer
+        self.vector_compare = VectorCompare(tokenizer)
+
+    def index(self, documents):
+        """
+        Index a stream of documents.
+
+        Args:
+            documents (iterable): (source, text) tuples, for example from read_documents.
+
+        Returns:
+            int: The number of documents indexed. Documents get ids 0, 1, 2, ... in order.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        segment_paths = []
+        postings_lists = {}
+        postings_in_memory = 0
+        doc_count = 0
+
+        with open(os.path.join(self.output_dir, 'documents.jsonl'), 'w', encoding='utf-8') as doc_file:
+            for doc_id, (source, text) in enumerate(documents):
+                concordance = self.vector_compare.concordance(text.lower())
+                for word, count in concordance.items():
+                    postings_lists.setdefault(word, []).append((doc_id, count))
+                postings_in_memory += len(concordance)
+
+                record = document_record(doc_id, source, text, concordance, self.vector_compare)
+                doc_file.write(json.dumps(record) + '\n')
+                doc_count += 1
+
+                if postings_in_memory >= self.max_postings:
+                    segment_paths.append(self._flush(postings_lists, len(segment_paths)))
+                    postings_lists = {}
+                    postings_in_memory = 0
+
+        if postings_lists or not segment_paths:
+            segment_paths.append(self._flush(postings_lists, len(segment_paths)))
+
+        self._merge(segment_paths)
+        return doc_count
+
+    def _merge(self, segment_paths):
+        """
+        Merge the segments into postings.txt and write the binary index.
+        """
+        postings_path = os.path.join(self.output_dir, 'postings.txt')
+        merge_segments(segment_paths, postings_path)
+        for path in segment_paths:
+            os.remove(path)
+
+        write_index(
+            self.output_dir,
+            read_postings_file(postings_path),
+            (
+                (document['magnitude'], document['log_magnitude'], document['length'])
+                for document in read_document_info(self.output_dir)
+            ),
+        )
+
+    def _flush(self, postings_lists, segment_number):
+        path = os.path.join(self.output_dir, 'segment-{:05d}.txt'.format(segment_number))
+        write_segment(postings_lists, path)
+        return path
+
+
+def document_record(doc_id, source, text, concordance, vector_compare):
+    """
+    Build the line written to documents.jsonl for a document.
+    """
+    return {
+        'id': doc_id,
+        'source': source,
+        'magnitude': vector_compare.magnitude(concordance),
+        'log_magnitude': log_magnitude(concordance),
+        'length': sum(concordance.values()),
+        'preview': text[:150],
+    }
+
+
+def merge_and_remove(segment_paths, output_path):
+    """
+    Merge segments into one and delete them. Runs in a worker process.
+    """
+    merge_segments(segment_paths, output_path)
+    for path in segment_paths:
+        os.remove(path)
+
+
+def index_batch(segment_path, first_doc_id, batch, tokenizer=None):
+    """
+    Index a batch of documents into one segment file. Runs in a worker process.
+
+    Args:
+        segment_path (str): Where to write the segment.
+        first_doc_id (int): Id of the first document of the batch; the others follow.
+        batch (list): (source, text) tuples.
+        tokenizer (Tokenizer): Tokenizer used to build concordances.
+
+    Returns:
+        list: The documents.jsonl records of the batch, in order.
+    """
+    vector_compare = VectorCompare(tokenizer)
+    postings_lists = {}
+    records = []
+    for doc_id, (source, text) in enumerate(batch, first_doc_id):
+        concordance = vector_compare.concordance(text.lower())
+        for word, count in concordance.items():
+            postings_lists.setdefault(word, []).append((doc_id, count))
+        records.append(document_record(doc_id, source, text, concordance, vector_compare))
+    write_segment(postings_lists, segment_path)
+    return records
+
+
+class ParallelIndexer(SpimiIndexer):
+    """
+    A SpimiIndexer that tokenizes documents in several processes.
+
+    The document stream is cut into batches of batch_size documents. Every batch gets
+    the next range of document ids and is sent to a ProcessPoolExecutor worker, which
+    writes it as a segment. The segments cover consecutive id ranges, so they are merged
+    exactly like the segments of SpimiIndexer. Every MERGE_FAN_IN finished segments are
+    merged into one by a worker while indexing goes on, so a large corpus does not end
+    with thousands of segments to merge.
+
+    Only a few batches per worker are in flight at any time, so reading the corpus never
+    runs far ahead of the workers and memory stays bounded.
+    """
+
+    def __init__(self, output_dir, workers=None, batch_size=1000, tokenizer=None):
+        super().__init__(output_dir, tokenizer=tokenizer)
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+
+    def index(self, documents):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        documents = iter(documents)
+        segments = []  # (path, future of the merge writing it) of merged runs of segments, in order
+        finished = []  # Paths of indexed segments not merged yet, in order
+        pending = deque()  # (path, future) of the batches being indexed, in document order
+        doc_count = 0
+        batch_number = 0
+
+        with open(os.path.join(self.output_dir, 'documents.jsonl'), 'w', encoding='utf-8') as doc_file, \
+                ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                batch = list(islice(documents, self.batch_size))
+                if batch:
+                    path = os.path.join(self.output_dir, 'segment-{:05d}.txt'.format(batch_number))
+                    pending.append((path, executor.submit(index_batch, path, doc_count, batch, self.tokenizer)))
+                    batch_number += 1
+                    doc_count += len(batch)
+
+                # Write the records of finished batches in order, waiting once enough are queued
+                while pending and (not batch or len(pending) >= 2 * self.workers or pending[0][1].done()):
+                    path, future = pending.popleft()
+                    for record in future.result():
+                        doc_file.write(json.dumps(record) + '\n')
+                    finished.append(path)
+                    if len(finished) == MERGE_FAN_IN:
+                        merged_path = os.path.join(self.output_dir, 'merged-{:05d}.txt'.format(len(segments)))
+                        segments.append((merged_path, executor.submit(merge_and_remove, finished, merged_path)))
+                        finished = []
+
+                if not batch:
+                    break
+
+            for _, future in segments:
+                future.result()
+
+        segment_paths = [path for path, _ in segments] + finished
+        if not segment_paths:
+            segment_paths.append(self._flush({}, 0))
+
+        self._merge(segment_paths)
+        return doc_count
+
+
+def read_document_info(index_dir):
+    """
+    Stream the document records written by SpimiIndexer.
+    """
+    with open(os.path.join(index_dir, 'documents.jsonl'), encoding='utf-8') as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def load_index(index_dir):
+    """
+    Load an index written by SpimiIndexer into an InvertedIndex.
+
+    Returns:
+        InvertedIndex: The index, ready to search.
+    """
+    index = InvertedIndex()
+    for document in read_document_info(index_dir):
+        index.add_document_statistics(
+            document['id'], document['magnitude'], document['log_magnitude'], document['length'])
+
+    for term, postings in read_postings_file(os.path.join(index_dir, 'postings.txt')):
+        index.add_postings(term, postings)
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Index a directory of text files or a JSONL file.')
+    parser.add_argument('corpus', help='directory of documents or JSONL file')
+    parser.add_argument('index_dir', help='where to write the index')
+    parser.add_argument('--max-postings', type=int, default=1000000,
+                        help='postings held in memory before a segment is written to disk')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes tokenizing documents (0 uses every core)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='documents per segment when indexing with several processes')
+    parser.add_argument('--tokenizer', choices=TOKENIZER_NAMES, default='whitespace',
+                        help='how documents are split into terms')
+    args = parser.parse_args()
+
+    tokenizer = make_tokenizer(args.tokenizer)
+    if args.workers == 1:
+        indexer = SpimiIndexer(args.index_dir, args.max_postings, tokenizer)
+    else:
+        indexer = ParallelIndexer(args.index_dir, args.workers or None, args.batch_size, tokenizer)
+    count = indexer.index(read_documents(args.corpus))
+    print('Indexed {} documents into {}'.format(count, args.index_dir))
@@ -0,0 +1,229 @@
+"""
+Where does the time of a query go?
+
+A Tracer collects the time spent in named stages and counters. InvertedIndex.search
+(and LiveIndex.search) accept one and report:
+
+    postings    looking up (and for a MappedIndex, decoding) the postings lists
+    traversal   walking the postings lists and scoring documents
+    sort        sorting the k best documents
+    documents_scored, postings_read   counters
+
+VectorCompare(tracer=...) times its concordance, relation and magnitude methods.
+
+Without a tracer the code only checks "tracer is not None" a few times per query, so
+instrumentation costs nothing measurable when it is off.
+
+QueryProfiler runs queries with a tracer each, adds them up into overall statistics,
+and logs the queries slower than a threshold to the 'search_engine.slow_queries'
+logger, optionally with a cProfile report and the peak memory from tracemalloc.
+"""
+
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+
+slow_query_logger = logging.getLogger('search_engine.slow_queries')
+
+
+class Tracer:
+    """
+    Time spent per stage and event counters.
+
+    Args:
+        clock: Function returning the current time in seconds.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.seconds = {}  # stage -> total seconds
+        self.calls = {}  # stage -> number of times it ran
+        self.counters = {}  # name -> total
+        self._last_lap = clock()
+
+    def add(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0) + seconds
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def lap(self, stage=None):
+        """
+        Charge the time since the previous lap to a stage. Without a stage, only start
+        timing from now.
+        """
+        now = self.clock()
+        if stage is not None:
+            self.add(stage, now - self._last_lap)
+        self._last_lap = now
+
+    @contextmanager
+    def stage(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(name, self.clock() - start)
+
+    def timed(self, stage, function):
+        """
+        Wrap a function so every call is charged to a stage.
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = self.clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, self.clock() - start)
+        return wrapper
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other):
+        """
+        Add the stages and counters of another tracer to this one.
+        """
+        for stage, seconds in other.seconds.items():
+            self.seconds[stage] = self.seconds.get(stage, 0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + other.calls[stage]
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+
+    def as_dict(self):
+        return {
+            'stages': {
+                stage: {'calls': self.calls[stage], 'ms': seconds * 1000}
+                for stage, seconds in self.seconds.items()
+            },
+            'counters': dict(self.counters),
+        }
+
+
+class QueryProfiler:
+    """
+    Run queries with instrumentation and keep a log of the slow ones.
+
+    Args:
+        slow_query_seconds (float): Queries taking at least this long are logged.
+        profile (bool): Run every query under cProfile and attach the report to slow
+            queries. cProfile slows queries down a lot, and only one query can be
+            profiled at a time, so queries run one at a time when this is on.
+        trace_memory (bool): Measure the peak memory of every query with tracemalloc
+            and attach it to slow queries. Also slow.
+        keep (int): Number of slow queries kept in slow_queries.
+    """
+
+    def __init__(self, slow_query_seconds=0.1, profile=False, trace_memory=False, keep=100):
+        self.slow_query_seconds = slow_query_seconds
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.totals = Tracer()
+        self.queries = 0
+        self.slow_queries = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+
+    def search(self, index, query_concordance, k=10, **options):
+        """
+        Run index.search(query_concordance, k, tracer=..., **options) and record it.
+
+        Returns:
+            list: The results of the search.
+        """
+        if self.profile or self.trace_memory:
+            with self._profile_lock:
+                return self._search(index, query_concordance, k, options)
+        return self._search(index, query_concordance, k, options)
+
+    def _search(self, index, query_concordance, k, options):
+        tracer = Tracer()
+        profiler = cProfile.Profile() if self.profile else None
+        tracing_memory = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing_memory:
+            tracemalloc.start()
+        if profiler is not None:
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            results = index.search(query_concordance, k, tracer=tracer, **options)
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            peak_memory = None
+            if tracing_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+        tracer.add('total', seconds)
+        with self._lock:
+            self.queries += 1
+            self.totals.merge(tracer)
+        if seconds >= self.slow_query_seconds:
+            self._log_slow_query(query_concordance, k, seconds, tracer, profiler, peak_memory)
+        return results
+
+    def _log_slow_query(self, query_concordance, k, seconds, tracer, profiler, peak_memory):
+        record = {'query': dict(query_concordance), 'k': k, 'ms': seconds * 1000}
+        record.update(tracer.as_dict())
+        if peak_memory is not None:
+            record['peak_memory'] = peak_memory
+        if profiler is not None:
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(15)
+            record['profile'] = report.getvalue()
+        with self._lock:
+            self.slow_queries.append(record)
+
+        slow_query_logger.warning(
+            'Slow query (%.1f ms): %s k=%d stages=%s counters=%s', record['ms'], ' '.join(record['query']), k,
+            {stage: round(values['ms'], 3) for stage, values in record['stages'].items()}, record['counters'])
+        if 'profile' in record:
+            slow_query_logger.debug('Profile of the slow query:\n%s', record['profile'])
+
+    def stats(self):
+        """
+        Return the totals over every query run so far.
+        """
+        with self._lock:
+            stats = self.totals.as_dict()
+            for values in stats['stages'].values():
+                values['mean_ms'] = values['ms'] / values['calls']
+            stats['queries'] = self.queries
+            stats['slow_queries'] = len(self.slow_queries)
+            return stats
+
+
+if __name__ == "__main__":
+    import json
+
+    from inverted_index import InvertedIndex
+    from vector_compare import VectorCompare, documents
+
+    logging.basicConfig(format='{asctime} - {name} - {levelname} - {message}', style='{', level=logging.INFO)
+
+    # Where the time goes when VectorCompare compares the query with every document
+    tracer = Tracer()
+    v = VectorCompare(tracer=tracer)
+    query = v.concordance('test driven development at scale')
+    with tracer.stage('ranking'):
+        sorted(((v.relation(query, v.concordance(text.lower())), doc_id) for doc_id, text in documents.items()),
+               reverse=True)
+    print(json.dumps(tracer.as_dict(), indent=2))
+
+    # The same query through the index, with every query slower than 0 seconds logged
+    index = InvertedIndex()
+    for doc_id, text in documents.items():
+        index.add_document(doc_id, VectorCompare().concordance(text.lower()))
+    profiler = QueryProfiler(slow_query_seconds=0, trace_memory=True)
+    profiler.search(index, query, k=3)
+    print(json.dumps(profiler.stats(), indent=2))
@@ -0,0 +1,280 @@
+import heapq
+from bisect import bisect_left
+from itertools import accumulate
+
+from scoring import CosineScorer, log_magnitude, log_weight
+from vector_compare import VectorCompare
+
+
+class InvertedIndex:
+    """
+    An inverted index maps every term to the list of documents that contain it
+    (its "postings list"), so a query only touches documents that share at least
+    one term with it instead of being compared against the whole corpus.
+
+    Example:
+        Documents {0: "cat dog cat", 1: "dog bird"} produce the postings
+        {'cat': [(0, 2)], 'dog': [(0, 1), (1, 1)], 'bird': [(1, 1)]}
+
+    Besides the postings, the statistics used by the scorers of scoring.py are computed
+    once, when a document is added: the magnitude, log magnitude and length of every
+    document, and the largest weight of every term.
+    """
+
+    def __init__(self):
+        self.vector_compare = VectorCompare()
+        self.postings_lists = {}  # term -> [(doc_id, count), ...] in the order documents were added
+        self.norms = {}  # doc_id -> magnitude of the document vector, computed once at indexing time
+        self.log_norms = {}  # doc_id -> magnitude of the document vector with log_weight(count) counts
+        self.lengths = {}  # doc_id -> number of words in the document
+        self.total_length = 0
+        self.max_weights = {}  # term -> highest count / magnitude found in its postings list
+        self.max_log_weights = {}  # term -> highest log_weight(count) / log magnitude in its postings list
+        self.max_counts = {}  # term -> highest count in its postings list
+        self.last_doc_id = None  # Largest id given to add_document, to keep postings sorted
+        self.generation = 0  # Incremented on every change, for caches
+
+    def add_document(self, doc_id, concordance):
+        """
+        Add a document to the index.
+
+        Args:
+            doc_id (int): Identifier of the document. Ids must be added in increasing order
+                so that every postings list stays sorted by document id.
+            concordance (dict): A dictionary with words as keys and their counts as values.
+                If it is a DocumentVector its cached magnitude is reused.
+
+        Raises:
+            ValueError: If the document id is already indexed or not larger than the ids
+                added before it.
+        """
+        if doc_id in self.norms:
+            raise ValueError('Document {} is already indexed'.format(doc_id))
+        if self.last_doc_id is not None and doc_id <= self.last_doc_id:
+            raise ValueError('Document {} added after document {}, ids must increase'.format(doc_id, self.last_doc_id))
+        self.last_doc_id = doc_id
+
+        self.add_document_statistics(
+            doc_id, self.vector_compare.magnitude(concordance), log_magnitude(concordance), sum(concordance.values()))
+        for word, count in concordance.items():
+            self.postings_lists.setdefault(word, []).append((doc_id, count))
+            self._update_term_statistics(word, doc_id, count)
+
+    def add_document_statistics(self, doc_id, magnitude, document_log_magnitude, length):
+        """
+        Record the statistics of a document without its postings.
+
+        Used together with add_postings to load an index that was built elsewhere.
+        """
+        self.norms[doc_id] = magnitude
+        self.log_norms[doc_id] = document_log_magnitude
+        self.lengths[doc_id] = length
+        self.total_length += length
+        self.generation += 1
+
+    def add_postings(self, term, postings):
+        """
+        Add the complete postings list of a term whose documents were already given to
+        add_document_statistics.
+        """
+        self.postings_lists[term] = postings
+        self.generation += 1
+        for doc_id, count in postings:
+            self._update_term_statistics(term, doc_id, count)
+
+    def _update_term_statistics(self, term, doc_id, count):
+        self.max_weights[term] = max(self.max_weights.get(term, 0), count / self.norms[doc_id])
+        self.max_log_weights[term] = max(
+            self.max_log_weights.get(term, 0), log_weight(count) / self.log_norms[doc_id])
+        self.max_counts[term] = max(self.max_counts.get(term, 0), count)
+
+    def postings(self, term):
+        """
+        Return the postings list of a term, or an empty list if the term is unknown.
+        """
+        return self.postings_lists.get(term, [])
+
+    def terms(self):
+        """
+        Iterate over every term of the index.
+        """
+        return iter(self.postings_lists)
+
+    def doc_ids(self):
+        """
+        Return the ids of every document, sorted.
+        """
+        return sorted(self.norms)
+
+    def document_frequency(self, term):
+        """
+        Return the number of documents containing a term.
+        """
+        return len(self.postings(term))
+
+    def norm(self, doc_id):
+        """
+        Return the precomputed magnitude of a document vector.
+        """
+        return self.norms[doc_id]
+
+    def log_norm(self, doc_id):
+        """
+        Return the precomputed magnitude of a document vector with log_weight(count) counts.
+        """
+        return self.log_norms[doc_id]
+
+    def length(self, doc_id):
+        """
+        Return the number of words of a document.
+        """
+        return self.lengths[doc_id]
+
+    def average_length(self):
+        """
+        Return the average number of words per document.
+        """
+        return self.total_length / len(self) if len(self) else 0
+
+    def term_upper_bound(self, term):
+        """
+        Return the most this term can add to the cosine score of any document, before it
+        is multiplied by the weight of the term in the query.
+        """
+        return self.max_weights.get(term, 0)
+
+    def term_log_upper_bound(self, term):
+        """
+        Return the largest log_weight(count) / log magnitude of the term in any document.
+        """
+        return self.max_log_weights.get(term, 0)
+
+    def term_max_count(self, term):
+        """
+        Return the largest count of the term in any document.
+        """
+        return self.max_counts.get(term, 0)
+
+    def __len__(self):
+        return len(self.norms)
+
+    def search(self, query_concordance, k=10, scorer=None, collection=None, deleted=None, tracer=None):
+        """
+        Return the k documents that score highest for the query.
+
+        Documents are visited in increasing id order across the postings lists of the
+        query terms (document-at-a-time) and only the best k are kept in a min-heap, so
+        memory stays at k entries no matter how many documents match.
+
+        The search also uses the MaxScore technique: every term has an upper bound on
+        what it can add to a score. Once the heap is full, the terms whose bounds added
+        together cannot beat the worst score in the heap are "non-essential": documents
+        that only contain those terms are skipped, and their postings are only probed
+        (with a binary search) for documents found through the other terms.
+
+        Args:
+            query_concordance (dict): Concordance of the query.
+            k (int): Number of results to return.
+            scorer: A scorer from scoring.py. Defaults to the cosine similarity returned
+                by VectorCompare.relation.
+            collection: Where the scorer reads collection statistics (document count,
+                document frequencies, average length). Defaults to this index.
+            deleted (set): Ids of documents to leave out of the results.
+            tracer: Optional Tracer (see instrumentation.py) told how long each stage of
+                the search took, how many documents were scored and postings read.
+
+        Returns:
+            list: Up to k (score, doc_id) tuples sorted by descending score.
+        """
+        if k <= 0:
+            return []
+        if scorer is None:
+            scorer = DEFAULT_SCORER
+        if collection is None:
+            collection = self
+        if tracer is not None:
+            tracer.lap()
+
+        # (upper bound, query weight, postings) for every query term found in the index
+        terms = []
+        for word, weight in scorer.query_weights(collection, query_concordance).items():
+            postings = self.postings(word)
+            if postings and weight > 0:
+                terms.append((weight * scorer.upper_bound(self, word), weight, postings))
+        terms.sort(key=lambda term: term[0])
+        if tracer is not None:
+            tracer.lap('postings')  # Includes decoding them, for a MappedIndex
+
+        bounds = list(accumulate(term[0] for term in terms))  # bounds[i]: best score from terms[0..i]
+        positions = [0] * len(terms)  # Cursor into every postings list
+        heap = []  # (score, doc_id) of the best k documents so far, worst on top
+        threshold = 0  # A document has to score more than this to enter the heap
+        first_essential = 0
+        term_weight = scorer.term_weight
+        scored = 0  # Documents whose score was computed
+        read = 0  # Postings whose count was used, not those skipped by a binary search
+
+        while True:
+            # Terms before first_essential cannot lift a document above the threshold on their own
+            while first_essential < len(terms) and bounds[first_essential] <= threshold:
+                first_essential += 1
+
+            # The next candidate is the smallest document id under the essential cursors
+            doc_id = None
+            for i in range(first_essential, len(terms)):
+                postings = terms[i][2]
+                if positions[i] < len(postings):
+                    candidate = postings[positions[i]][0]
+                    if doc_id is None or candidate < doc_id:
+                        doc_id = candidate
+            if doc_id is None:
+                break
+
+            if deleted and doc_id in deleted:
+                for i in range(first_essential, len(terms)):
+                    postings = terms[i][2]
+                    if positions[i] < len(postings) and postings[positions[i]][0] == doc_id:
+                        positions[i] += 1
+                continue
+
+            scored += 1
+            document_factor = scorer.document_factor(self, collection, doc_id)
+            score = 0
+            for i in range(first_essential, len(terms)):
+                postings = terms[i][2]
+                position = positions[i]
+                if position < len(postings) and postings[position][0] == doc_id:
+                    score += terms[i][1] * term_weight(postings[position][1], document_factor)
+                    positions[i] = position + 1
+                    read += 1
+
+            # Probe the non-essential terms, largest bound first, while the document can still make it
+            for i in range(first_essential - 1, -1, -1):
+                if score + bounds[i] <= threshold:
+                    break
+                postings = terms[i][2]
+                position = bisect_left(postings, (doc_id,), positions[i])
+                positions[i] = position
+                if position < len(postings) and postings[position][0] == doc_id:
+                    score += terms[i][1] * term_weight(postings[position][1], document_factor)
+                    read += 1
+
+            if len(heap) < k:
+                heapq.heappush(heap, (score, doc_id))
+                if len(heap) == k:
+                    threshold = heap[0][0]
+            elif score > threshold:
+                heapq.heapreplace(heap, (score, doc_id))
+                threshold = heap[0][0]
+
+        if tracer is not None:
+            tracer.lap('traversal')
+            tracer.count('documents_scored', scored)
+            tracer.count('postings_read', read)
+        results = sorted(heap, reverse=True)
+        if tracer is not None:
+            tracer.lap('sort')
+        return results
+
+
+DEFAULT_SCORER = CosineScorer()
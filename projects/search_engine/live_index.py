@@ -0,0 +1,308 @@
+import heapq
+import threading
+
+from inverted_index import InvertedIndex
+
+
+class Segment:
+    """
+    An InvertedIndex that no longer changes, with its level in the merge tree.
+
+    Segments sealed from the buffer are level 0. Merging merge_factor segments of
+    level n produces one segment of level n + 1.
+    """
+
+    def __init__(self, index, level=0):
+        self.index = index
+        self.level = level
+
+
+class LiveCollection:
+    """
+    Collection statistics of a LiveIndex, added up over all of its segments, for the
+    scorers of scoring.py.
+
+    Deleted documents keep counting in the number of documents and the average length
+    until a merge drops their postings, like they keep counting in document frequencies,
+    so a document frequency is never larger than the number of documents.
+    """
+
+    def __init__(self, indexes, doc_count, total_length):
+        self.indexes = indexes
+        self.doc_count = doc_count
+        self.total_length = total_length
+
+    def __len__(self):
+        return self.doc_count
+
+    def document_frequency(self, term):
+        return sum(index.document_frequency(term) for index in self.indexes)
+
+    def average_length(self):
+        return self.total_length / self.doc_count if self.doc_count else 0
+
+
+class LiveIndex:
+    """
+    A search index that documents can be added to, updated in and deleted from while
+    it is being searched, without ever being rebuilt.
+
+    The index is a list of segments:
+        - New documents go into a small in-memory buffer (an InvertedIndex). When it
+          holds max_buffer_documents documents it is sealed into a read-only segment.
+        - Deleting a document only adds its id to a set of "tombstones". Searches skip
+          tombstoned documents, and merges leave them out. The set is replaced rather
+          than changed (a frozenset), so a search can keep using it without copying.
+        - Updating a document deletes it and adds the new version with a new id.
+        - When merge_factor segments of the same level pile up, a background thread
+          merges them into one bigger segment. Because segments
+          are read-only, searches keep using the old ones until the merged segment is
+          swapped in, so queries never wait for a merge. A segment where more than
+          max_deleted_fraction of the documents are deleted is rewritten on its own, so
+          tombstones do not pile up in big segments that rarely merge.
+
+    Documents are identified by keys chosen by the caller; internally every version of
+    a document gets a new integer id, so ids keep growing across segments and postings
+    stay sorted.
+    """
+
+    def __init__(self, max_buffer_documents=1000, merge_factor=4, background=True, max_deleted_fraction=0.3):
+        """
+        Args:
+            max_buffer_documents (int): Documents held in the buffer before it is sealed.
+            merge_factor (int): Number of segments of the same level merged together.
+            max_deleted_fraction (float): Fraction of deleted documents above which a
+                segment is rewritten without them.
+            background (bool): Merge in a background thread. When False, merges run in
+                the thread that sealed the buffer.
+        """
+        self.max_buffer_documents = max_buffer_documents
+        self.merge_factor = merge_factor
+        self.max_deleted_fraction = max_deleted_fraction
+
+        self.segments = []  # Sealed segments, oldest (lowest ids) first
+        self.buffer = InvertedIndex()
+        self.tombstones = frozenset()  # Internal ids of deleted documents
+        self.ids = {}  # key -> internal id of the live version of the document
+        self.keys = {}  # internal id -> key
+        self.next_id = 0
+        self.total_length = 0  # Words in stored documents, live or tombstoned
+        self.generation = 0  # Incremented on every change, for caches
+
+        self._lock = threading.RLock()
+        self._merge_wanted = threading.Condition(self._lock)
+        self._merging = False
+        self._closed = False
+        self._merge_thread = None
+        if background:
+            self._merge_thread = threading.Thread(target=self._merge_loop, daemon=True)
+            self._merge_thread.start()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    def add_document(self, key, concordance):
+        """
+        Add a document.
+
+        Args:
+            key: Identifier of the document chosen by the caller.
+            concordance (dict): A dictionary with words as keys and their counts as values.
+
+        Raises:
+            ValueError: If a document with this key is already indexed.
+        """
+        with self._lock:
+            if key in self.ids:
+                raise ValueError('Document {} is already indexed'.format(key))
+
+            doc_id = self.next_id
+            self.next_id += 1
+            self.buffer.add_document(doc_id, concordance)
+            self.ids[key] = doc_id
+            self.keys[doc_id] = key
+            self.total_length += self.buffer.length(doc_id)
+            self.generation += 1
+
+            if len(self.buffer) >= self.max_buffer_documents:
+                self.flush()
+
+    def update_document(self, key, concordance):
+        """
+        Replace a document with a new version, or add it if it is not indexed.
+        """
+        with self._lock:
+            if key in self.ids:
+                self.delete_document(key)
+            self.add_document(key, concordance)
+
+    def delete_document(self, key):
+        """
+        Delete a document.
+
+        Raises:
+            KeyError: If no document with this key is indexed.
+        """
+        with self._lock:
+            doc_id = self.ids.pop(key)
+            del self.keys[doc_id]
+            self.tombstones = self.tombstones | {doc_id}
+            self.generation += 1
+
+    def flush(self):
+        """
+        Seal the buffer into a segment, and merge segments if there are enough of them.
+        """
+        with self._lock:
+            if len(self.buffer) == 0:
+                return
+            self.segments = self.segments + [Segment(self.buffer)]
+            self.buffer = InvertedIndex()
+            if self._merge_thread is not None:
+                self._merge_wanted.notify()
+        if self._merge_thread is None:
+            while self._merge_once():
+                pass
+
+    def search(self, query_concordance, k=10, scorer=None, tracer=None):
+        """
+        Return the k best live documents for the query.
+
+        Every segment is searched on its own for its best k documents, skipping
+        tombstones, and the results are merged. The segment list is copied under the
+        lock, so a merge finishing in the meantime does not affect this query.
+
+        The tracer, if any, is passed to the search of every segment.
+
+        Returns:
+            list: Up to k (score, key) tuples sorted by descending score.
+        """
+        with self._lock:
+            segments = self.segments
+            tombstones = self.tombstones
+            collection = LiveCollection(
+                [segment.index for segment in segments] + [self.buffer],
+                len(self.ids) + len(self.tombstones), self.total_length)
+            # The buffer changes with every add, so it is searched while holding the lock
+            results = self.buffer.search(
+                query_concordance, k, scorer=scorer, collection=collection, deleted=tombstones, tracer=tracer)
+
+        for segment in segments:
+            results.extend(segment.index.search(
+                query_concordance, k, scorer=scorer, collection=collection, deleted=tombstones, tracer=tracer))
+
+        best = heapq.nlargest(k, results)
+        with self._lock:
+            # A document deleted while the segments were searched is dropped here
+            return [(score, self.keys[doc_id]) for score, doc_id in best if doc_id in self.keys]
+
+    def _mergeable(self):
+        """
+        Return the (start, end) positions of the segments to merge next, or None: the
+        first run of merge_factor segments of the same level, otherwise the first
+        segment with more than max_deleted_fraction of its documents deleted.
+
+        Levels never increase along the segment list, so merging the oldest segments of
+        a level puts the new, higher level segment right after the segments of higher
+        levels, and the list stays ordered. A segment rewritten alone keeps its level.
+        """
+        run_start = 0
+        for position, segment in enumerate(self.segments):
+            if segment.level != self.segments[run_start].level:
+                run_start = position
+            if position - run_start + 1 == self.merge_factor:
+                return run_start, position + 1
+
+        tombstones = self.tombstones
+        if tombstones:
+            for position, segment in enumerate(self.segments):
+                deleted = sum(1 for doc_id in segment.index.norms if doc_id in tombstones)
+                if deleted > self.max_deleted_fraction * len(segment.index):
+                    return position, position + 1
+        return None
+
+    def _merge_once(self):
+        """
+        Merge one group of segments if there is one. Returns whether a merge happened.
+        """
+        with self._lock:
+            mergeable = self._mergeable()
+            if mergeable is None or self._merging:
+                return False
+            self._merging = True
+            start, end = mergeable
+            to_merge = self.segments[start:end]
+            tombstones = self.tombstones
+
+        try:
+            merged = merge_indexes([segment.index for segment in to_merge], tombstones)
+        except BaseException:
+            with self._lock:
+                self._merging = False
+            raise
+
+        with self._lock:
+            # Segments are only appended while a merge runs, so the merged group is still in place
+            level = to_merge[0].level + (1 if len(to_merge) > 1 else 0)
+            # A segment whose documents were all deleted disappears
+            replacement = [Segment(merged, level)] if len(merged) else []
+            self.segments = self.segments[:start] + replacement + self.segments[end:]
+            dropped = set()
+            for segment in to_merge:
+                # These tombstones were applied by the merge and are not needed anymore
+                segment_dropped = tombstones.intersection(segment.index.norms)
+                dropped.update(segment_dropped)
+                self.total_length -= sum(segment.index.length(doc_id) for doc_id in segment_dropped)
+            self.tombstones = self.tombstones - dropped
+            self._merging = False
+            self.generation += 1
+        return True
+
+    def _merge_loop(self):
+        while True:
+            with self._lock:
+                while not self._closed and self._mergeable() is None:
+                    self._merge_wanted.wait()
+                if self._closed:
+                    return
+            self._merge_once()
+
+    def close(self):
+        """
+        Stop the background merge thread.
+        """
+        with self._lock:
+            self._closed = True
+            self._merge_wanted.notify()
+        if self._merge_thread is not None:
+            self._merge_thread.join()
+
+
+def merge_indexes(indexes, deleted=()):
+    """
+    Merge indexes holding consecutive ranges of document ids into a new InvertedIndex,
+    leaving out deleted documents.
+    """
+    merged = InvertedIndex()
+    for index in indexes:
+        for doc_id in index.norms:
+            if doc_id not in deleted:
+                merged.add_document_statistics(
+                    doc_id, index.norm(doc_id), index.log_norm(doc_id), index.length(doc_id))
+
+    terms = set()
+    for index in indexes:
+        terms.update(index.terms())
+    for term in terms:
+        postings = [
+            posting
+            for index in indexes
+            for posting in index.postings(term)
+            if posting[0] not in deleted
+        ]
+        if postings:
+            merged.add_postings(term, postings)
+    return merged
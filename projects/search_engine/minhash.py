@@ -0,0 +1,185 @@
+"""
+Near-duplicate detection with MinHash and locality-sensitive hashing (LSH).
+
+Comparing every document with every other one with VectorCompare.relation takes n²
+comparisons. Instead, every document is summarized by a MinHash signature:
+
+    - The document is cut into shingles (runs of shingle_size consecutive words).
+    - num_perm hash functions are applied to every shingle, and the signature keeps
+      the smallest value of each. Two documents get the same value for one hash
+      function with a probability equal to the Jaccard similarity of their shingles.
+
+The signature is then cut into bands of rows values. Documents with an identical band
+land in the same bucket and become candidates, which happens with probability
+1 - (1 - s ** rows) ** bands for a Jaccard similarity s: an S-shaped curve that is
+steepest around (1 / bands) ** (1 / rows). Only candidates are compared, with the
+cosine similarity of VectorCompare, so the final answers are exact.
+
+Requires numpy.
+"""
+
+import zlib
+
+import numpy as np
+
+from vector_compare import DocumentVector, VectorCompare
+
+
+PRIME = (1 << 31) - 1  # Hashes are computed modulo this Mersenne prime
+
+
+class MinHashLSH:
+    """
+    An index of MinHash signatures for finding near-duplicate documents.
+
+    Args:
+        num_perm (int): Number of hash functions, i.e. values per signature.
+        bands (int): Number of bands the signature is cut into. Must divide num_perm.
+        shingle_size (int): Number of consecutive words per shingle.
+        tokenizer (Tokenizer): Splits documents into words. Without one, lowercased
+            text is split on whitespace, like VectorCompare.concordance.
+        seed (int): Seed of the hash functions. Signatures are only comparable between
+            indexes built with the same seed and num_perm.
+
+    Raises:
+        ValueError: If bands does not divide num_perm.
+    """
+
+    def __init__(self, num_perm=128, bands=32, shingle_size=3, tokenizer=None, seed=1):
+        if num_perm % bands:
+            raise ValueError('bands ({}) should divide num_perm ({})'.format(bands, num_perm))
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.tokenizer = tokenizer
+        self.vector_compare = VectorCompare(tokenizer)
+
+        # Hash function i maps a shingle hash h (below PRIME) to (a[i] * h + b[i]) mod
+        # PRIME. Every product is below 2 ** 62, so uint64 arithmetic never overflows
+        random = np.random.default_rng(seed)
+        self.a = random.integers(1, PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.b = random.integers(0, PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+        self.signatures = {}  # doc_id -> signature (uint64 array of num_perm values)
+        self.vectors = {}  # doc_id -> DocumentVector, for the final cosine check
+        self.order = {}  # doc_id -> number of documents added before it, to sort ties without comparing ids
+        self.buckets = [{} for _ in range(bands)]  # per band: band bytes -> [doc_id, ...]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def tokens(self, text):
+        if self.tokenizer is not None:
+            return self.tokenizer.tokens(text)
+        return text.lower().split()
+
+    def shingles(self, words):
+        """
+        Return the set of shingles of a list of words. A document shorter than
+        shingle_size is a single shingle.
+        """
+        size = self.shingle_size
+        if len(words) <= size:
+            return {' '.join(words)}
+        return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+    def signature(self, text):
+        """
+        Return the MinHash signature of a text.
+        """
+        # crc32 gives the same value in every process, unlike hash() on strings
+        shingles = self.shingles(self.tokens(text))
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) % PRIME for shingle in shingles), dtype=np.uint64)
+        return ((self.a * hashes + self.b) % PRIME).min(axis=1)
+
+    def _bands(self, signature):
+        rows = self.rows
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def add_document(self, doc_id, text):
+        """
+        Add a document.
+
+        Raises:
+            ValueError: If the document id is already indexed.
+        """
+        if doc_id in self.signatures:
+            raise ValueError('Document {} is already indexed'.format(doc_id))
+        signature = self.signature(text)
+        self.order[doc_id] = len(self.signatures)
+        self.signatures[doc_id] = signature
+        self.vectors[doc_id] = DocumentVector(self.vector_compare.concordance(text.lower()))
+        for buckets, band in zip(self.buckets, self._bands(signature)):
+            buckets.setdefault(band, []).append(doc_id)
+
+    def candidates(self, text):
+        """
+        Return the ids of the documents sharing at least one band with a text.
+        """
+        found = set()
+        for buckets, band in zip(self.buckets, self._bands(self.signature(text))):
+            found.update(buckets.get(band, ()))
+        return found
+
+    def estimated_similarity(self, doc_id1, doc_id2):
+        """
+        Estimate the Jaccard similarity of the shingles of two indexed documents from
+        their signatures.
+        """
+        return float(np.mean(self.signatures[doc_id1] == self.signatures[doc_id2]))
+
+    def query(self, text, threshold=0.8):
+        """
+        Find the indexed documents whose cosine similarity with a text is at least threshold.
+
+        Documents that share no band with the text are never compared, so a few true
+        matches can be missed; that is the price of not comparing every document.
+
+        Returns:
+            list: (cosine similarity, doc_id) tuples sorted by descending similarity, then
+            in the order documents were added.
+        """
+        vector = DocumentVector(self.vector_compare.concordance(text.lower()))
+        results = []
+        for doc_id in self.candidates(text):
+            similarity = self.vector_compare.relation(vector, self.vectors[doc_id])
+            if similarity >= threshold:
+                results.append((similarity, doc_id))
+        return sorted(results, key=lambda result: (-result[0], self.order[result[1]]))
+
+    def duplicates(self, threshold=0.8):
+        """
+        Find the pairs of indexed documents whose cosine similarity is at least threshold.
+
+        Returns:
+            list: (cosine similarity, doc_id1, doc_id2) tuples sorted by descending
+            similarity, with doc_id1 added before doc_id2.
+        """
+        order = self.order
+        pairs = set()
+        for buckets in self.buckets:
+            for doc_ids in buckets.values():
+                for i, doc_id1 in enumerate(doc_ids):
+                    for doc_id2 in doc_ids[i + 1:]:
+                        pairs.add((doc_id1, doc_id2) if order[doc_id1] < order[doc_id2] else (doc_id2, doc_id1))
+
+        results = []
+        for doc_id1, doc_id2 in pairs:
+            similarity = self.vector_compare.relation(self.vectors[doc_id1], self.vectors[doc_id2])
+            if similarity >= threshold:
+                results.append((similarity, doc_id1, doc_id2))
+        return sorted(results, key=lambda result: (-result[0], order[result[1]], order[result[2]]))
+
+
+if __name__ == "__main__":
+    from vector_compare import documents
+
+    lsh = MinHashLSH()
+    for doc_id, text in documents.items():
+        lsh.add_document(doc_id, text)
+    # A copy of document 0 with one word changed, as a crawler might find it on another site
+    lsh.add_document('copy of 0', documents[0].replace('diddly squat', 'nothing'))
+
+    for similarity, doc_id1, doc_id2 in lsh.duplicates(threshold=0.8):
+        print('{:.3f}  {!r} ~ {!r}'.format(similarity, doc_id1, doc_id2))
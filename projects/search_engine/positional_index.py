@@ -0,0 +1,218 @@
+import math
+from array import array
+
+from index_format import decode_varint, encode_varint
+
+
+class PositionalPostings:
+    """
+    The postings list of one term in a PositionalIndex.
+
+    Document ids are kept in an array('L') in increasing order. The positions of the
+    term in each document are stored as varint-encoded gaps (like the postings of the
+    binary index format) in one bytearray, and offsets[i] says where the positions of
+    the i-th document start, so positions are only decoded for documents that survive
+    the intersection.
+    """
+
+    def __init__(self):
+        self.doc_ids = array('L')
+        self.offsets = array('L')
+        self.positions = bytearray()
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def add(self, doc_id, positions):
+        self.doc_ids.append(doc_id)
+        self.offsets.append(len(self.positions))
+        previous = 0
+        for position in positions:
+            encode_varint(position - previous, self.positions)
+            previous = position
+
+    def positions_at(self, i):
+        """
+        Decode the positions of the i-th document of the list.
+        """
+        end = self.offsets[i + 1] if i + 1 < len(self.offsets) else len(self.positions)
+        positions = []
+        position = 0
+        cursor = self.offsets[i]
+        while cursor < end:
+            gap, cursor = decode_varint(self.positions, cursor)
+            position += gap
+            positions.append(position)
+        return positions
+
+    def skip_to(self, i, target):
+        """
+        Return the first index at or after i whose document id is >= target.
+
+        Skip pointers are implicit: every sqrt(n)-th entry is one, so the cursor first
+        jumps sqrt(n) entries at a time while that does not pass the target, then walks
+        the remaining entries one by one.
+        """
+        doc_ids = self.doc_ids
+        step = max(1, int(math.sqrt(len(doc_ids))))
+        while i + step < len(doc_ids) and doc_ids[i + step] <= target:
+            i += step
+        while i < len(doc_ids) and doc_ids[i] < target:
+            i += 1
+        return i
+
+
+class PositionalIndex:
+    """
+    An index that remembers where every word occurs in every document, for phrase
+    queries ("test driven development" as consecutive words) and proximity queries
+    (all the words within a few words of each other).
+
+    Args:
+        tokenizer (Tokenizer): Splits documents and queries into terms. Without one,
+            lowercased text is split on whitespace, like VectorCompare.concordance.
+    """
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+        self.postings_lists = {}  # term -> PositionalPostings
+        self.last_doc_id = None  # Largest id added, to keep postings sorted
+
+    def positions(self, text):
+        """
+        Return the (position, term) tuples of a text. Dropped stopwords leave gaps.
+        """
+        if self.tokenizer is not None:
+            return self.tokenizer.positions(text)
+        return list(enumerate(text.lower().split()))
+
+    def add_document(self, doc_id, text):
+        """
+        Add a document.
+
+        Raises:
+            ValueError: If the id is not larger than the ids added before it.
+        """
+        if self.last_doc_id is not None and doc_id <= self.last_doc_id:
+            raise ValueError('Document {} added after document {}, ids must increase'.format(doc_id, self.last_doc_id))
+        self.last_doc_id = doc_id
+        positions = {}
+        for position, term in self.positions(text):
+            positions.setdefault(term, []).append(position)
+        for term, term_positions in positions.items():
+            self.postings_lists.setdefault(term, PositionalPostings()).add(doc_id, term_positions)
+
+    def _intersect(self, terms):
+        """
+        Find the documents containing every term.
+
+        The shortest postings list drives the intersection, and the cursors of the other
+        lists skip ahead to each candidate.
+
+        Returns:
+            list: (doc_id, [index of the document in each term's postings]) tuples,
+            with the indexes in the order of terms.
+        """
+        postings = [self.postings_lists.get(term) for term in terms]
+        if not postings or any(p is None for p in postings):
+            return []
+
+        order = sorted(range(len(terms)), key=lambda i: len(postings[i]))
+        cursors = [0] * len(terms)
+        shortest = postings[order[0]]
+        matches = []
+        for i, doc_id in enumerate(shortest.doc_ids):
+            cursors[order[0]] = i
+            found = True
+            for term_number in order[1:]:
+                term_postings = postings[term_number]
+                cursor = term_postings.skip_to(cursors[term_number], doc_id)
+                cursors[term_number] = cursor
+                if cursor == len(term_postings):
+                    return matches  # This list is exhausted: no later document can match
+                if term_postings.doc_ids[cursor] != doc_id:
+                    found = False
+                    break
+            if found:
+                matches.append((doc_id, list(cursors)))
+        return matches
+
+    def phrase_search(self, phrase):
+        """
+        Find the documents where the words of the phrase appear next to each other, in order.
+
+        Stopwords dropped by the tokenizer must be matched by as many words in the
+        document: "cat of the house" matches "cat in a house" but not "cat house".
+
+        Returns:
+            list: (doc_id, number of occurrences of the phrase) tuples in doc id order.
+        """
+        positions = self.positions(phrase)
+        if not positions:
+            return []
+        first = positions[0][0]
+        offsets = [position - first for position, _ in positions]
+        terms = [term for _, term in positions]
+        results = []
+        for doc_id, cursors in self._intersect(terms):
+            # Shift the positions of each word back by its offset in the phrase: occurrences
+            # line up on the same start
+            starts = None
+            for offset, term, cursor in zip(offsets, terms, cursors):
+                positions = {position - offset for position in self.postings_lists[term].positions_at(cursor)}
+                starts = positions if starts is None else starts & positions
+                if not starts:
+                    break
+            if starts:
+                results.append((doc_id, len(starts)))
+        return results
+
+    def proximity_search(self, query, window):
+        """
+        Find the documents where all the words of the query occur within a span of
+        window words, in any order.
+
+        Returns:
+            list: (doc_id, length of the smallest span holding every word) tuples in doc id order.
+        """
+        terms = list(dict.fromkeys(term for _, term in self.positions(query)))  # Unique words, in query order
+        results = []
+        for doc_id, cursors in self._intersect(terms):
+            occurrences = sorted(
+                (position, number)
+                for number, (term, cursor) in enumerate(zip(terms, cursors))
+                for position in self.postings_lists[term].positions_at(cursor)
+            )
+            span = smallest_span(occurrences, len(terms))
+            if span <= window:
+                results.append((doc_id, span))
+        return results
+
+
+def smallest_span(occurrences, term_count):
+    """
+    Length of the smallest run of positions that contains every term at least once.
+
+    Args:
+        occurrences (list): (position, term number) tuples sorted by position.
+        term_count (int): Number of different terms.
+
+    Uses a sliding window: the right end moves forward one occurrence at a time, and
+    the left end moves forward as long as the window still holds every term.
+    """
+    counts = [0] * term_count
+    covered = 0
+    best = math.inf
+    left = 0
+    for position, term in occurrences:
+        if counts[term] == 0:
+            covered += 1
+        counts[term] += 1
+        while covered == term_count:
+            left_position, left_term = occurrences[left]
+            best = min(best, position - left_position + 1)
+            counts[left_term] -= 1
+            if counts[left_term] == 0:
+                covered -= 1
+            left += 1
+    return best
@@ -0,0 +1,289 @@
+"""
+Compressed postings lists with interchangeable codecs.
+
+A postings list is stored as two streams of small non-negative integers: the gaps
+between consecutive document ids, and the counts. Each stream is encoded by a codec:
+
+    vbyte   7 bits per byte, the high bit says whether more bytes follow (the format
+            of index_format.py). Byte aligned, so it decodes fast.
+    gamma   Elias gamma: n written as (number of bits - 1) zeros followed by n in
+            binary. 1 bit for n = 1, 3 bits for 2 and 3, 5 bits for 4 to 7, ...
+    delta   Elias delta: the number of bits of n in gamma, then n without its leading
+            1 bit. Longer than gamma for tiny numbers, much shorter for large ones.
+    for     Frame of reference: values are cut into blocks of 128, and each block
+            stores its smallest value and then every value minus it, packed with the
+            number of bits the largest one needs.
+
+Gamma and delta cannot encode 0, so they encode every value plus one.
+
+Encoded streams are bytes, and decoded ones are array('L'), so a postings list never
+becomes a list of Python ints and tuples unless postings() is asked for one.
+"""
+
+import sys
+from array import array
+from itertools import accumulate
+
+from index_format import decode_varint, encode_varint
+from inverted_index import InvertedIndex
+
+
+class VByteCodec:
+    name = 'vbyte'
+
+    def encode(self, values):
+        out = bytearray()
+        for value in values:
+            encode_varint(value, out)
+        return bytes(out)
+
+    def decode(self, data, count):
+        values = array('L')
+        position = 0
+        for _ in range(count):
+            value, position = decode_varint(data, position)
+            values.append(value)
+        return values
+
+
+def _bits_to_bytes(bits):
+    """
+    Turn a string of '0' and '1' into bytes, padding the end with zeros.
+    """
+    bits += '0' * (-len(bits) % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b''
+
+
+def _bytes_to_bits(data):
+    return format(int.from_bytes(data, 'big'), '0{}b'.format(len(data) * 8)) if data else ''
+
+
+class GammaCodec:
+    name = 'gamma'
+
+    def encode(self, values):
+        pieces = []
+        for value in values:
+            binary = bin(value + 1)[2:]
+            pieces.append('0' * (len(binary) - 1))
+            pieces.append(binary)
+        return _bits_to_bytes(''.join(pieces))
+
+    def decode(self, data, count):
+        bits = _bytes_to_bits(data)
+        values = array('L')
+        position = 0
+        for _ in range(count):
+            zeros = bits.find('1', position) - position
+            end = position + 2 * zeros + 1
+            values.append(int(bits[position + zeros:end], 2) - 1)
+            position = end
+        return values
+
+
+class DeltaCodec:
+    name = 'delta'
+
+    def encode(self, values):
+        pieces = []
+        for value in values:
+            binary = bin(value + 1)[2:]
+            length = bin(len(binary))[2:]
+            pieces.append('0' * (len(length) - 1))
+            pieces.append(length)
+            pieces.append(binary[1:])
+        return _bits_to_bytes(''.join(pieces))
+
+    def decode(self, data, count):
+        bits = _bytes_to_bits(data)
+        values = array('L')
+        position = 0
+        for _ in range(count):
+            zeros = bits.find('1', position) - position
+            end = position + 2 * zeros + 1
+            length = int(bits[position + zeros:end], 2)
+            position = end + length - 1
+            values.append(int('1' + bits[end:position], 2) - 1)
+        return values
+
+
+class FrameOfReferenceCodec:
+    """
+    Args:
+        block_size (int): Number of values sharing a base and a bit width.
+    """
+
+    name = 'for'
+
+    def __init__(self, block_size=128):
+        self.block_size = block_size
+
+    def encode(self, values):
+        out = bytearray()
+        for start in range(0, len(values), self.block_size):
+            block = values[start:start + self.block_size]
+            base = min(block)
+            width = (max(block) - base).bit_length()
+            encode_varint(base, out)
+            out.append(width)
+            packed = 0
+            for i, value in enumerate(block):
+                packed |= (value - base) << (i * width)
+            out += packed.to_bytes((len(block) * width + 7) // 8, 'little')
+        return bytes(out)
+
+    def decode(self, data, count):
+        values = array('L')
+        position = 0
+        while len(values) < count:
+            block_length = min(self.block_size, count - len(values))
+            base, position = decode_varint(data, position)
+            width = data[position]
+            position += 1
+            end = position + (block_length * width + 7) // 8
+            packed = int.from_bytes(data[position:end], 'little')
+            position = end
+            mask = (1 << width) - 1
+            values.extend(base + ((packed >> (i * width)) & mask) for i in range(block_length))
+        return values
+
+
+CODECS = {codec.name: codec for codec in (VByteCodec(), GammaCodec(), DeltaCodec(), FrameOfReferenceCodec())}
+
+
+class CompressedPostings:
+    """
+    The postings list of one term, as encoded doc id gaps and counts.
+
+    Args:
+        postings (list): (doc_id, count) tuples sorted by doc_id.
+        codec: One of the codecs of CODECS.
+    """
+
+    def __init__(self, postings, codec):
+        self.codec = codec
+        self.length = len(postings)
+        gaps = array('L')
+        counts = array('L')
+        previous = 0
+        for doc_id, count in postings:
+            gaps.append(doc_id - previous)
+            counts.append(count)
+            previous = doc_id
+        self.gaps = codec.encode(gaps)
+        self.counts = codec.encode(counts)
+
+    def __len__(self):
+        return self.length
+
+    def size(self):
+        """
+        Return the number of bytes of the encoded streams.
+        """
+        return len(self.gaps) + len(self.counts)
+
+    def doc_ids(self):
+        return array('L', accumulate(self.codec.decode(self.gaps, self.length)))
+
+    def term_counts(self):
+        return self.codec.decode(self.counts, self.length)
+
+    def decode(self):
+        """
+        Return the postings as a list of (doc_id, count) tuples.
+        """
+        return list(zip(self.doc_ids(), self.term_counts()))
+
+
+class CompressedIndex(InvertedIndex):
+    """
+    An InvertedIndex whose postings lists are kept compressed, and decoded when a query
+    needs them.
+
+    Postings lists are encoded whole, so documents cannot be added one at a time: build
+    an InvertedIndex and convert it with compress_index, or use add_document_statistics
+    and add_postings like load_index does.
+
+    Args:
+        codec (str): Name of a codec of CODECS.
+
+    Raises:
+        ValueError: If the codec is unknown.
+    """
+
+    def __init__(self, codec='vbyte'):
+        super().__init__()
+        if codec not in CODECS:
+            raise ValueError('Unknown codec {!r}, expected one of {}'.format(codec, ', '.join(CODECS)))
+        self.codec = CODECS[codec]
+
+    def add_document(self, doc_id, concordance):
+        raise ValueError('Documents cannot be added to a CompressedIndex, use compress_index')
+
+    def add_postings(self, term, postings):
+        super().add_postings(term, postings)
+        self.postings_lists[term] = CompressedPostings(postings, self.codec)
+
+    def postings(self, term):
+        compressed = self.postings_lists.get(term)
+        return compressed.decode() if compressed is not None else []
+
+    def document_frequency(self, term):
+        compressed = self.postings_lists.get(term)
+        return len(compressed) if compressed is not None else 0
+
+    def postings_size(self):
+        """
+        Return the number of bytes taken by the encoded postings.
+        """
+        return sum(compressed.size() for compressed in self.postings_lists.values())
+
+
+def compress_index(index, codec='vbyte'):
+    """
+    Copy an InvertedIndex into a CompressedIndex.
+    """
+    compressed = CompressedIndex(codec)
+    for doc_id in index.doc_ids():
+        compressed.add_document_statistics(doc_id, index.norm(doc_id), index.log_norm(doc_id), index.length(doc_id))
+    for term in index.terms():
+        compressed.add_postings(term, index.postings(term))
+    return compressed
+
+
+def list_size(postings):
+    """
+    Approximate bytes taken by a postings list held as a Python list of (doc_id, count) tuples.
+    """
+    size = sys.getsizeof(postings)
+    for posting in postings:
+        size += sys.getsizeof(posting)
+        size += sum(sys.getsizeof(value) for value in posting if value > 256)  # Ints up to 256 are shared
+    return size
+
+
+if __name__ == "__main__":
+    import time
+
+    from benchmark import zipf_concordances
+
+    # A synthetic corpus whose word frequencies follow Zipf's law, like natural text
+    index = InvertedIndex()
+    for doc_id, concordance in zipf_concordances(3000, 20000, max_length=300).items():
+        index.add_document(doc_id, concordance)
+
+    posting_count = sum(len(postings) for postings in index.postings_lists.values())
+    lists_bytes = sum(list_size(postings) for postings in index.postings_lists.values())
+    print('{} documents, {} terms, {} postings'.format(len(index), len(index.postings_lists), posting_count))
+    print('{:<8} {:>10} {:>14} {:>18}'.format('codec', 'MB', 'bits/posting', 'postings decoded/s'))
+    print('{:<8} {:>10.2f} {:>14.1f} {:>18}'.format('lists', lists_bytes / 1e6, lists_bytes * 8 / posting_count, '-'))
+    for name in CODECS:
+        compressed = compress_index(index, name)
+        size = compressed.postings_size()
+        start = time.perf_counter()
+        for postings in compressed.postings_lists.values():
+            postings.doc_ids()
+            postings.term_counts()
+        seconds = time.perf_counter() - start
+        print('{:<8} {:>10.2f} {:>14.1f} {:>18,.0f}'.format(
+            name, size / 1e6, size * 8 / posting_count, posting_count / seconds))
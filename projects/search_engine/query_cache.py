@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+from inverted_index import DEFAULT_SCORER
+
+
+class QueryCache:
+    """
+    Remember the results of recent queries.
+
+    Entries are keyed on the normalized query (its sorted word counts, so "Cat dog" and
+    "dog cat" share an entry), k, the scorer and the generation of the index. Indexes
+    increment their generation whenever they change, so results computed before a
+    change are never returned after it; the first lookup that sees a new generation
+    empties the cache.
+
+    The cache holds at most max_size entries and drops the least recently used one
+    when it is full (an OrderedDict keeps them in use order). Entries older than ttl
+    seconds are dropped when they are looked up.
+    """
+
+    def __init__(self, max_size=1024, ttl=60, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (time stored, results), least recently used first
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query_concordance, k, scorer, generation):
+        # The scorer's parameters are part of the key: BM25Scorer(k1=3.0) does not give
+        # the results of BM25Scorer()
+        scorer_key = type(scorer).__name__, tuple(sorted(vars(scorer).items()))
+        return generation, tuple(sorted(query_concordance.items())), k, scorer_key
+
+    def get(self, key):
+        """
+        Return the cached results for a key, or None.
+        """
+        with self._lock:
+            generation = key[0]
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+
+            entry = self.entries.get(key)
+            if entry is not None and self.clock() - entry[0] > self.ttl:
+                del self.entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, results):
+        with self._lock:
+            if key[0] != self.generation:
+                return  # The index changed while these results were computed
+            self.entries[key] = (self.clock(), results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def search(self, index, query_concordance, k=10, scorer=None):
+        """
+        Search an index through the cache.
+
+        Works with any index that has a search(query, k, scorer=...) method; indexes
+        without a generation attribute are treated as never changing.
+        """
+        key = self.key(query_concordance, k, scorer or DEFAULT_SCORER, getattr(index, 'generation', 0))
+        results = self.get(key)
+        if results is None:
+            results = index.search(query_concordance, k, scorer=scorer)
+            self.put(key, results)
+        return results
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0,
+        }
@@ -0,0 +1,147 @@
+"""
+Scoring functions for InvertedIndex.search.
+
+A score is always a sum over the query terms found in a document:
+
+    score(document) = sum of query_weight(term) * term_weight(count, document_factor(document))
+
+so that the search can accumulate it while reading postings lists and bound what every
+term can add (upper_bound) for MaxScore pruning. Everything that depends on the whole
+collection (number of documents, document frequencies, average length) is folded into
+the query weights or the document factor, and comes from statistics computed when the
+documents were indexed.
+
+The collection argument is the object holding those statistics. It is normally the
+index itself, but can be a wrapper that adds up several indexes (segments or shards).
+It must support len(collection), collection.document_frequency(term) and
+collection.average_length().
+"""
+
+import math
+
+
+def log_weight(count):
+    """
+    Dampened term frequency: a word seen 10 times is not 10 times as important.
+    """
+    return 1 + math.log(count)
+
+
+def log_magnitude(concordance):
+    """
+    Magnitude of a document vector whose counts were replaced by log_weight(count).
+    """
+    return math.sqrt(sum(log_weight(count) ** 2 for count in concordance.values()))
+
+
+class CosineScorer:
+    """
+    Cosine similarity of raw word counts, the score of VectorCompare.relation.
+    """
+
+    name = 'cosine'
+
+    def query_weights(self, collection, query_concordance):
+        magnitude = math.sqrt(sum(count ** 2 for count in query_concordance.values()))
+        if magnitude == 0:
+            return {}
+        return {term: count / magnitude for term, count in query_concordance.items()}
+
+    def document_factor(self, index, collection, doc_id):
+        return index.norm(doc_id)
+
+    def term_weight(self, count, document_factor):
+        return count / document_factor
+
+    def upper_bound(self, index, term):
+        return index.term_upper_bound(term)
+
+
+class TfIdfScorer:
+    """
+    Cosine similarity of TF-IDF vectors (the "lnc.ltc" scheme).
+
+    Documents use log_weight(count) normalized by their log magnitude, which does not
+    depend on the rest of the collection and is therefore computed once at indexing
+    time. Queries use log_weight(count) * idf(term), where
+
+        idf(term) = log(number of documents / number of documents containing term)
+
+    so words that appear everywhere, like "the", count for almost nothing.
+    """
+
+    name = 'tfidf'
+
+    def idf(self, collection, term):
+        document_frequency = collection.document_frequency(term)
+        if document_frequency == 0 or len(collection) == 0:
+            return 0
+        return math.log(len(collection) / document_frequency)
+
+    def query_weights(self, collection, query_concordance):
+        weights = {}
+        for term, count in query_concordance.items():
+            weight = log_weight(count) * self.idf(collection, term)
+            if weight > 0:
+                weights[term] = weight
+        magnitude = math.sqrt(sum(weight ** 2 for weight in weights.values()))
+        return {term: weight / magnitude for term, weight in weights.items()}
+
+    def document_factor(self, index, collection, doc_id):
+        return index.log_norm(doc_id)
+
+    def term_weight(self, count, document_factor):
+        return log_weight(count) / document_factor
+
+    def upper_bound(self, index, term):
+        return index.term_log_upper_bound(term)
+
+
+class BM25Scorer:
+    """
+    Okapi BM25.
+
+        score = sum of idf(term) * count * (k1 + 1) / (count + k1 * (1 - b + b * length / average length))
+
+    k1 controls how quickly repeated words stop adding to the score and b how much long
+    documents are penalized. The document part k1 * (1 - b + b * length / average length)
+    is computed once per document, from the length stored at indexing time.
+    """
+
+    name = 'bm25'
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+
+    def idf(self, collection, term):
+        document_frequency = collection.document_frequency(term)
+        if document_frequency == 0:
+            return 0
+        # The "+ 1" keeps the idf positive for words found in more than half the documents
+        return math.log(1 + (len(collection) - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def query_weights(self, collection, query_concordance):
+        weights = {}
+        for term, count in query_concordance.items():
+            weight = count * self.idf(collection, term)
+            if weight > 0:
+                weights[term] = weight
+        return weights
+
+    def document_factor(self, index, collection, doc_id):
+        average_length = collection.average_length()
+        if average_length == 0:
+            return self.k1
+        return self.k1 * (1 - self.b + self.b * index.length(doc_id) / average_length)
+
+    def term_weight(self, count, document_factor):
+        return count * (self.k1 + 1) / (count + document_factor)
+
+    def upper_bound(self, index, term):
+        # The weight grows with the count and shrinks with the length, so the largest
+        # count of the term in an (impossible) empty document bounds it from above
+        return self.term_weight(index.term_max_count(term), self.k1 * (1 - self.b))
+
+
+SCORERS = {scorer.name: scorer for scorer in (CosineScorer(), TfIdfScorer(), BM25Scorer())}
@@ -0,0 +1,331 @@
+"""
+An HTTP/JSON front-end for a MappedIndex.
+
+    GET  /search?q=test+driven+development&k=10&scorer=bm25
+    POST /search  {"query": "test driven development", "k": 10, "scorer": "bm25"}
+
+    -> {"results": [{"id": 4, "score": 0.31}, ...]}
+
+    GET  /stats   -> {"cache": {"hits": ..., "misses": ..., ...}, "pending": ...}
+
+The event loop only parses requests and writes responses. Scoring is CPU-bound, so it
+runs in a pool of worker processes that each open the index with mmap (sharing the
+same pages in memory). Queries arriving within batch_wait seconds of each other are
+sent to a worker together, which saves one round trip to the pool per query.
+
+Queries are tokenized by the event loop, and the results of repeated queries are
+served from a QueryCache without reaching the workers.
+
+When max_pending queries are already waiting, new ones are answered at once with
+503 Service Unavailable instead of queueing up, so latency stays predictable under
+overload and clients know to back off.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from index_format import MappedIndex
+from query_cache import QueryCache
+from scoring import SCORERS
+from tokenizer import TOKENIZER_NAMES, make_tokenizer
+from vector_compare import VectorCompare
+
+
+_worker_index = None
+
+
+def _init_worker(index_dir):
+    # Runs once in every worker process
+    global _worker_index
+    _worker_index = MappedIndex(index_dir)
+
+
+def search_batch(queries):
+    """
+    Run a batch of queries in a worker process.
+
+    Args:
+        queries (list): (query concordance, k, scorer name) tuples.
+
+    Returns:
+        list: For every query, a list of (score, doc_id) tuples.
+    """
+    return [
+        _worker_index.search(query_concordance, k, scorer=SCORERS[scorer_name])
+        for query_concordance, k, scorer_name in queries
+    ]
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class SearchServer:
+    """
+    Serve searches over HTTP with asyncio.
+
+    Args:
+        index_dir (str): Directory of an index in the binary format.
+        tokenizer_name (str): Tokenizer the index was built with (see tokenizer.py).
+        workers (int): Number of worker processes scoring queries.
+        max_batch (int): Most queries sent to a worker at once.
+        batch_wait (float): Seconds to wait for more queries before sending a batch.
+        max_pending (int): Queries waiting or being scored before new ones get a 503.
+        max_k (int): Largest number of results a query may ask for.
+        cache_size (int): Number of query results kept in the cache (0 disables it).
+        cache_ttl (float): Seconds a cached result stays valid.
+    """
+
+    def __init__(self, index_dir, tokenizer_name='whitespace', workers=None, max_batch=64,
+                 batch_wait=0.002, max_pending=10000, max_k=100, cache_size=10000, cache_ttl=60):
+        self.index_dir = index_dir
+        self.vector_compare = VectorCompare(make_tokenizer(tokenizer_name))
+        self.cache = QueryCache(cache_size, cache_ttl) if cache_size else None
+        self.workers = workers or os.cpu_count()
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.max_pending = max_pending
+        self.max_k = max_k
+
+        self.pending = 0
+        self.queue = None
+        self.executor = None
+        self.server = None
+        self.batcher = None
+        self.batches = set()  # Running batch tasks, referenced so they are not garbage collected
+
+    async def start(self, host='127.0.0.1', port=8080):
+        self.queue = asyncio.Queue()
+        # Forked workers would inherit the sockets of open client connections and keep
+        # them open after the server closes them, so the workers are spawned instead
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(self.index_dir,))
+        self.batcher = asyncio.create_task(self._batch_loop())
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        self.executor.shutdown()
+
+    async def search(self, text, k, scorer_name):
+        """
+        Answer a query from the cache, or queue it for the next batch and wait for its results.
+
+        Raises:
+            HttpError: 503 if max_pending queries are already waiting.
+        """
+        query_concordance = dict(self.vector_compare.query_vector(text))
+        if self.cache is not None:
+            key = self.cache.key(query_concordance, k, SCORERS[scorer_name], 0)  # A MappedIndex never changes
+            results = self.cache.get(key)
+            if results is not None:
+                return results
+
+        if self.pending >= self.max_pending:
+            raise HttpError(503, 'Too many pending queries')
+        self.pending += 1
+        try:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put(((query_concordance, k, scorer_name), future))
+            results = await future
+        finally:
+            self.pending -= 1
+
+        if self.cache is not None:
+            self.cache.put(key, results)
+        return results
+
+    def stats(self):
+        return {
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'pending': self.pending,
+        }
+
+    async def _batch_loop(self):
+        """
+        Group queued queries into batches and hand them to the worker pool.
+
+        At most one batch per worker is in flight, so queries wait in the queue (where
+        they can still be batched together) rather than inside the pool.
+        """
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(self.workers)
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await in_flight.acquire()
+            task = asyncio.create_task(self._run_batch(batch, in_flight))
+            self.batches.add(task)
+            task.add_done_callback(self.batches.discard)
+
+    async def _run_batch(self, batch, in_flight):
+        try:
+            queries = [query for query, _ in batch]
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, search_batch, queries)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            in_flight.release()
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Answer requests on a connection until the client closes it (HTTP keep-alive).
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = await self._handle_request(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request_line, reader, writer):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            self._respond(writer, 400, {'error': 'Malformed request line'}, False)
+            return False
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+        body = b''
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            self._respond(writer, 400, {'error': 'Bad Content-Length'}, False)
+            return False
+        if length > 1 << 20:
+            self._respond(writer, 413, {'error': 'Request body too large'}, False)
+            return False
+        if length:
+            body = await reader.readexactly(length)
+
+        try:
+            if urlsplit(target).path == '/stats':
+                self._respond(writer, 200, self.stats(), keep_alive)
+                return keep_alive
+            text, k, scorer_name = self._parse_query(method, target, body)
+            results = await self.search(text, k, scorer_name)
+            payload = {'results': [{'id': doc_id, 'score': score} for score, doc_id in results]}
+            self._respond(writer, 200, payload, keep_alive)
+        except HttpError as error:
+            self._respond(writer, error.status, {'error': str(error)}, keep_alive)
+        except Exception as error:
+            self._respond(writer, 500, {'error': repr(error)}, False)
+            return False
+        return keep_alive
+
+    def _parse_query(self, method, target, body):
+        url = urlsplit(target)
+        if url.path != '/search':
+            raise HttpError(404, 'Unknown path {}'.format(url.path))
+
+        if method == 'GET':
+            params = {name: values[0] for name, values in parse_qs(url.query).items()}
+            text = params.get('q', '')
+        elif method == 'POST':
+            try:
+                params = json.loads(body or b'{}')
+            except ValueError:
+                raise HttpError(400, 'Body is not valid JSON')
+            if not isinstance(params, dict):
+                raise HttpError(400, 'Body should be a JSON object')
+            text = params.get('query', '')
+        else:
+            raise HttpError(405, 'Use GET or POST')
+
+        try:
+            k = int(params.get('k', 10))
+        except (TypeError, ValueError):
+            raise HttpError(400, 'k should be an integer')
+        scorer_name = params.get('scorer', 'cosine')
+        if not isinstance(text, str):
+            raise HttpError(400, 'The query should be a string')
+        if scorer_name not in SCORERS:
+            raise HttpError(400, 'Unknown scorer {!r}'.format(scorer_name))
+        return text, max(0, min(k, self.max_k)), scorer_name
+
+    def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        headers = [
+            'HTTP/1.1 {} {}'.format(status, REASONS[status]),
+            'Content-Type: application/json',
+            'Content-Length: {}'.format(len(body)),
+            'Connection: {}'.format('keep-alive' if keep_alive else 'close'),
+        ]
+        if status == 503:
+            headers.append('Retry-After: 1')
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+
+
+async def main(args):
+    server = SearchServer(args.index_dir, args.tokenizer, args.workers or None, args.max_batch,
+                          args.batch_wait, args.max_pending, cache_size=args.cache_size, cache_ttl=args.cache_ttl)
+    await server.start(args.host, args.port)
+    print('Serving {} on http://{}:{}/search'.format(args.index_dir, args.host, args.port))
+    try:
+        await asyncio.Event().wait()  # Serve until interrupted
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve searches over an index written by indexer.py.')
+    parser.add_argument('index_dir')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--tokenizer', choices=TOKENIZER_NAMES, default='whitespace',
+                        help='must match the tokenizer the index was built with')
+    parser.add_argument('--workers', type=int, default=0, help='scoring processes (0 uses every core)')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--batch-wait', type=float, default=0.002)
+    parser.add_argument('--max-pending', type=int, default=10000)
+    parser.add_argument('--cache-size', type=int, default=10000, help='cached query results (0 disables the cache)')
+    parser.add_argument('--cache-ttl', type=float, default=60, help='seconds a cached result stays valid')
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
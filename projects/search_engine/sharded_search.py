@@ -0,0 +1,209 @@
+"""
+Sharded search: the corpus is split across worker processes that search in parallel.
+
+Documents are assigned to shards by doc_id % shards, and every shard is an
+InvertedIndex in its own process, so the corpus can use the memory and the cores of
+several processes. A query is sent to every shard at once (scatter); each shard returns
+its k best documents, and the coordinator keeps the k best of those (gather).
+
+Scores from different shards are only comparable if they use the same collection
+statistics. A shard only knows its own documents, so its idf of a word would depend on
+how many of the word's documents happened to land in it. The coordinator therefore
+keeps the global statistics (document count, total length and the document frequency
+of every term) and sends them with every query, and the results are the same as those
+of a single index holding the whole corpus.
+"""
+
+import heapq
+import multiprocessing
+from collections import Counter
+
+from inverted_index import DEFAULT_SCORER, InvertedIndex
+
+
+class GlobalCollection:
+    """
+    Collection statistics of the whole corpus, for the scorers of scoring.py.
+
+    Only the document frequencies of the query terms are sent to the shards.
+    """
+
+    def __init__(self, doc_count, total_length, document_frequencies):
+        self.doc_count = doc_count
+        self.total_length = total_length
+        self.document_frequencies = document_frequencies
+
+    def __len__(self):
+        return self.doc_count
+
+    def document_frequency(self, term):
+        return self.document_frequencies.get(term, 0)
+
+    def average_length(self):
+        return self.total_length / self.doc_count if self.doc_count else 0
+
+
+def _shard_worker(connection):
+    """
+    Serve one shard: answer the commands of the coordinator until told to stop.
+
+    Every command gets exactly one reply, ('ok', result) or ('error', exception).
+    """
+    index = InvertedIndex()
+    while True:
+        command, *arguments = connection.recv()
+        if command == 'stop':
+            connection.close()
+            return
+        try:
+            if command == 'add':
+                for doc_id, concordance in arguments[0]:
+                    index.add_document(doc_id, concordance)
+                result = len(index)
+            elif command == 'search':
+                query_concordance, k, scorer, collection = arguments
+                result = index.search(query_concordance, k, scorer=scorer, collection=collection)
+            else:
+                raise ValueError('Unknown command {!r}'.format(command))
+            connection.send(('ok', result))
+        except Exception as error:
+            connection.send(('error', error))
+
+
+class ShardedIndex:
+    """
+    An index split over worker processes.
+
+    Args:
+        shards (int): Number of shards, i.e. worker processes.
+        batch_size (int): Documents sent to a shard at once while indexing.
+
+    Document ids must be integers; document d goes to shard d % shards, and the ids of a
+    shard must be added in increasing order.
+    """
+
+    def __init__(self, shards=4, batch_size=1000):
+        self.shards = shards
+        self.batch_size = batch_size
+        self.doc_ids = set()
+        self.total_length = 0
+        self.document_frequencies = Counter()
+        self.last_doc_ids = [None] * shards  # Largest id added to each shard
+        self.pending = [[] for _ in range(shards)]  # Documents not sent to their shard yet
+
+        # Spawned rather than forked, for the same reason as the workers of server.py
+        context = multiprocessing.get_context('spawn')
+        self.connections = []
+        self.processes = []
+        for _ in range(shards):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=_shard_worker, args=(worker_connection,), daemon=True)
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def add_document(self, doc_id, concordance):
+        """
+        Add a document. It is sent to its shard in a batch, at the latest by the next search.
+
+        Raises:
+            ValueError: If the document id is not an integer, is already indexed, or is
+                not larger than the ids added to its shard before it.
+        """
+        if not isinstance(doc_id, int) or isinstance(doc_id, bool):
+            raise ValueError('Document ids must be integers, got {!r}'.format(doc_id))
+        if doc_id in self.doc_ids:
+            raise ValueError('Document {} is already indexed'.format(doc_id))
+        shard = doc_id % self.shards
+        last_doc_id = self.last_doc_ids[shard]
+        if last_doc_id is not None and doc_id < last_doc_id:
+            raise ValueError('Document {} added after document {} of the same shard, ids must increase'.format(
+                doc_id, last_doc_id))
+
+        self.doc_ids.add(doc_id)
+        self.last_doc_ids[shard] = doc_id
+        self.total_length += sum(concordance.values())
+        self.document_frequencies.update(concordance.keys())
+        self.pending[shard].append((doc_id, concordance))
+        if len(self.pending[shard]) >= self.batch_size:
+            self._call([shard], ('add', self.pending[shard]))
+            self.pending[shard] = []
+
+    def flush(self):
+        """
+        Send the pending documents to their shards.
+        """
+        shards = [shard for shard in range(self.shards) if self.pending[shard]]
+        for shard in shards:
+            self.connections[shard].send(('add', self.pending[shard]))
+            self.pending[shard] = []
+        self._gather(shards)
+
+    def _call(self, shards, message):
+        for shard in shards:
+            self.connections[shard].send(message)
+        return self._gather(shards)
+
+    def _gather(self, shards):
+        """
+        Collect one reply from each shard, in the order of shards. Every reply is read
+        before an error is raised, so the connections stay in step.
+        """
+        replies = [self.connections[shard].recv() for shard in shards]
+        for status, result in replies:
+            if status == 'error':
+                raise result
+        return [result for _, result in replies]
+
+    def collection(self, query_concordance):
+        """
+        Return the global statistics needed to score a query.
+        """
+        return GlobalCollection(
+            len(self.doc_ids), self.total_length,
+            {term: self.document_frequencies[term] for term in query_concordance if term in self.document_frequencies})
+
+    def search(self, query_concordance, k=10, scorer=None):
+        """
+        Search every shard in parallel and merge their results.
+
+        Returns:
+            list: Up to k (score, doc_id) tuples sorted by descending score.
+        """
+        self.flush()
+        # The scorer itself is sent, with its parameters (such as BM25's k1 and b)
+        message = ('search', dict(query_concordance), k, scorer or DEFAULT_SCORER, self.collection(query_concordance))
+        results = self._call(range(self.shards), message)
+        return heapq.nlargest(k, (result for shard_results in results for result in shard_results))
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        for connection in self.connections:
+            connection.send(('stop',))
+            connection.close()
+        for process in self.processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    from scoring import SCORERS
+    from vector_compare import VectorCompare, documents
+
+    v = VectorCompare()
+    sharded = ShardedIndex(shards=2)
+    single = InvertedIndex()
+    for doc_id, text in documents.items():
+        sharded.add_document(doc_id, v.concordance(text.lower()))
+        single.add_document(doc_id, v.concordance(text.lower()))
+
+    query = v.query_vector('test driven development at scale')
+    for name, scorer in SCORERS.items():
+        print(name, sharded.search(query, k=3, scorer=scorer))
+        print(name, single.search(query, k=3, scorer=scorer), '(one index)')
+    sharded.close()
@@ -0,0 +1,194 @@
+"""
+Query-aware snippets: the part of a result that best matches the query, highlighted.
+
+When a document is stored, it is tokenized once and the term id and character offsets
+of every token are kept in arrays:
+
+    term_ids  array('I')  the id of every token in a shared TermDictionary
+    starts    array('I')  where every token starts in the text
+    ends      array('I')  where it ends
+
+Making a snippet then only compares integers: the tokens whose id is one of the query's
+are found in term_ids, the window of tokens holding the most of them is chosen, and the
+offsets say which characters of the stored text to cut and where to put the highlights.
+The text is never tokenized again.
+"""
+
+import re
+from array import array
+
+from term_dictionary import TermDictionary
+
+
+WHITESPACE_TOKEN = re.compile(r'\S+')
+
+
+class StoredDocument:
+    __slots__ = ('text', 'term_ids', 'starts', 'ends')
+
+    def __init__(self, text, term_ids, starts, ends):
+        self.text = text
+        self.term_ids = term_ids
+        self.starts = starts
+        self.ends = ends
+
+
+class SnippetStore:
+    """
+    Document texts with the positions of their terms, to make snippets.
+
+    Args:
+        tokenizer (Tokenizer): Must be the tokenizer the index was built with. Without
+            one, lowercased text is split on whitespace, like VectorCompare.concordance.
+        dictionary (TermDictionary): Dictionary to share with other structures (see
+            term_dictionary.py). A new one is made by default.
+    """
+
+    def __init__(self, tokenizer=None, dictionary=None):
+        self.tokenizer = tokenizer
+        self.dictionary = dictionary if dictionary is not None else TermDictionary()
+        self.documents = {}  # doc_id -> StoredDocument
+
+    def __len__(self):
+        return len(self.documents)
+
+    def spans(self, text):
+        """
+        Return the (term, start, end) tuples of a text.
+        """
+        if self.tokenizer is not None:
+            return self.tokenizer.spans(text)
+        return [(match.group().lower(), match.start(), match.end()) for match in WHITESPACE_TOKEN.finditer(text)]
+
+    def add_document(self, doc_id, text):
+        """
+        Store a document.
+
+        Raises:
+            ValueError: If the document id is already stored.
+        """
+        if doc_id in self.documents:
+            raise ValueError('Document {} is already stored'.format(doc_id))
+        term_ids = array('I')
+        starts = array('I')
+        ends = array('I')
+        for term, start, end in self.spans(text):
+            term_ids.append(self.dictionary.add(term))
+            starts.append(start)
+            ends.append(end)
+        self.documents[doc_id] = StoredDocument(text, term_ids, starts, ends)
+
+    def query_term_ids(self, query):
+        """
+        Return the ids of the terms of a query text that appear in some stored document.
+        """
+        term_ids = (self.dictionary.get(term) for term, _, _ in self.spans(query))
+        return {term_id for term_id in term_ids if term_id is not None}
+
+    def snippet(self, doc_id, query, window=30, highlight=('<b>', '</b>'), query_term_ids=None):
+        """
+        Return the window of the document that best matches the query, with the query
+        terms highlighted.
+
+        The best window holds the most different query terms, then the most occurrences
+        of them. Documents without any query term start their snippet at the beginning.
+
+        Args:
+            doc_id: Id of a stored document.
+            query (str): The query text.
+            window (int): Number of tokens in the snippet.
+            highlight (tuple): Strings put before and after every query term.
+            query_term_ids (set): The ids of the query terms, if already computed with
+                query_term_ids, to skip tokenizing the query again.
+
+        Returns:
+            str: The snippet, with "..." where the text was cut.
+
+        Raises:
+            ValueError: If window is smaller than 1.
+        """
+        if window < 1:
+            raise ValueError('window should be at least 1')
+        document = self.documents[doc_id]
+        if query_term_ids is None:
+            query_term_ids = self.query_term_ids(query)
+        term_ids = document.term_ids
+        if not term_ids:
+            return document.text.strip()
+
+        matches = [position for position, term_id in enumerate(term_ids) if term_id in query_term_ids]
+        first = self._best_window(term_ids, matches, window)
+        last = min(len(term_ids), first + window) - 1
+
+        pieces = []
+        if first > 0:
+            pieces.append('...')
+        cursor = document.starts[first]
+        for position in matches:
+            if first <= position <= last:
+                start, end = document.starts[position], document.ends[position]
+                pieces.extend((document.text[cursor:start], highlight[0], document.text[start:end], highlight[1]))
+                cursor = end
+        pieces.append(document.text[cursor:document.ends[last]])
+        if last < len(term_ids) - 1:
+            pieces.append('...')
+        return ''.join(pieces)
+
+    @staticmethod
+    def _best_window(term_ids, matches, window):
+        """
+        Return the first token position of the best window.
+
+        Only windows starting at a match are tried, with a second cursor tracking the
+        last match inside the window, so the work is proportional to the number of
+        matches. The chosen window is then moved back to center its matches.
+        """
+        if not matches:
+            return 0
+        best = None
+        counts = {}  # term id -> occurrences in the current window
+        end = 0  # matches[end] is the first match after the current window
+        for begin, position in enumerate(matches):
+            while end < len(matches) and matches[end] < position + window:
+                term_id = term_ids[matches[end]]
+                counts[term_id] = counts.get(term_id, 0) + 1
+                end += 1
+            score = (len(counts), end - begin)
+            if best is None or score > best[0]:
+                best = (score, begin, end)
+            term_id = term_ids[position]
+            counts[term_id] -= 1
+            if counts[term_id] == 0:
+                del counts[term_id]
+
+        _, begin, end = best
+        span = matches[end - 1] - matches[begin] + 1
+        first = matches[begin] - (window - span) // 2
+        return max(0, min(first, len(term_ids) - window))
+
+    def snippets(self, results, query, window=30, highlight=('<b>', '</b>')):
+        """
+        Return a snippet for every (score, doc_id) result of a search.
+        """
+        query_term_ids = self.query_term_ids(query)
+        return [
+            self.snippet(doc_id, query, window, highlight, query_term_ids)
+            for _, doc_id in results
+        ]
+
+
+if __name__ == "__main__":
+    from inverted_index import InvertedIndex
+    from vector_compare import VectorCompare, documents
+
+    v = VectorCompare()
+    index = InvertedIndex()
+    store = SnippetStore()
+    for doc_id, text in documents.items():
+        index.add_document(doc_id, v.concordance(text.lower()))
+        store.add_document(doc_id, text)
+
+    query = 'captcha numbers'
+    results = index.search(v.query_vector(query), k=3)
+    for (score, doc_id), snippet in zip(results, store.snippets(results, query, highlight=('**', '**'))):
+        print('{:.3f}  {}\n'.format(score, snippet))
@@ -0,0 +1,135 @@
+import numpy as np
+from scipy import sparse
+
+
+class SparseMatrixIndex:
+    """
+    A vectorized alternative to VectorCompare for scoring many queries at once.
+
+    Every word of the corpus gets a column number (the vocabulary) and the corpus is
+    stored as a CSR sparse matrix with one row per document. The rows are divided by
+    their magnitude when the index is built, so the cosine similarity of a whole batch
+    of queries is a single sparse matrix product:
+
+        scores = normalized queries (q x words) @ normalized documents.T (words x d)
+
+    Requires numpy and scipy.
+    """
+
+    def __init__(self, concordances):
+        """
+        Build the index.
+
+        Args:
+            concordances (dict): doc_id -> concordance (dict of word counts).
+        """
+        self.doc_ids = []
+        self.vocabulary = {}  # word -> column
+
+        indptr = [0]
+        indices = []
+        data = []
+        for doc_id, concordance in concordances.items():
+            self.doc_ids.append(doc_id)
+            for word, count in concordance.items():
+                indices.append(self.vocabulary.setdefault(word, len(self.vocabulary)))
+                data.append(count)
+            indptr.append(len(indices))
+
+        matrix = sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(self.doc_ids), len(self.vocabulary)),
+        )
+        # Stored transposed (words x documents) in CSR form, built once: queries @ documents
+        # is then a CSR @ CSR product, without scipy converting the corpus on every search
+        self.documents = self._normalize(matrix).T.tocsr()
+
+    @staticmethod
+    def _normalize(matrix, magnitudes=None):
+        """
+        Divide every row by its L2 norm (or by the given magnitudes). Empty rows stay empty.
+        """
+        if magnitudes is None:
+            magnitudes = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        inverse = np.divide(1.0, magnitudes, out=np.zeros_like(magnitudes), where=magnitudes > 0)
+        return sparse.diags(inverse) @ matrix
+
+    def _query_matrix(self, query_concordances):
+        """
+        Turn queries into a normalized CSR matrix over the index vocabulary.
+
+        Words the index has never seen cannot match anything and are left out of the
+        matrix, but they still count towards the query magnitude, like in VectorCompare.
+        """
+        indptr = [0]
+        indices = []
+        data = []
+        magnitudes = []
+        for concordance in query_concordances:
+            total = 0
+            for word, count in concordance.items():
+                total += count ** 2
+                column = self.vocabulary.get(word)
+                if column is not None:
+                    indices.append(column)
+                    data.append(count)
+            magnitudes.append(total ** 0.5)
+            indptr.append(len(indices))
+
+        matrix = sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(magnitudes), len(self.vocabulary)),
+        )
+        return self._normalize(matrix, np.array(magnitudes, dtype=np.float64))
+
+    def search_batch(self, query_concordances, k=10, batch_size=1024):
+        """
+        Score a list of queries against the whole corpus.
+
+        Queries are processed batch_size at a time so the score matrix of a huge
+        query list never has to fit in memory at once.
+
+        Args:
+            query_concordances (list): Concordances of the queries.
+            k (int): Number of results to return per query.
+            batch_size (int): Number of queries multiplied in one matrix product.
+
+        Returns:
+            list: For every query, up to k (score, doc_id) tuples sorted by descending score.
+        """
+        results = []
+        for start in range(0, len(query_concordances), batch_size):
+            queries = self._query_matrix(query_concordances[start:start + batch_size])
+            scores = (queries @ self.documents).tocsr()  # One row of scores per query
+            for row in range(scores.shape[0]):
+                results.append(self._top_k(scores, row, k))
+        return results
+
+    def search(self, query_concordance, k=10):
+        """
+        Score a single query. See search_batch.
+        """
+        return self.search_batch([query_concordance], k)[0]
+
+    def _top_k(self, scores, row, k):
+        """
+        Pick the k best documents of one row of the score matrix.
+
+        Only the non-zero scores of the row are looked at, and argpartition finds the k
+        largest of them in linear time before sorting just those k.
+        """
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        values = scores.data[start:end]
+        columns = scores.indices[start:end]
+        positive = values > 0
+        values, columns = values[positive], columns[positive]
+        if k <= 0 or len(values) == 0:
+            return []
+
+        if len(values) > k:
+            best = np.argpartition(-values, k - 1)[:k]
+            values, columns = values[best], columns[best]
+        # Highest score first, then the document added last, without comparing the ids
+        # themselves, which can be of any type
+        order = np.lexsort((-columns, -values))
+        return [(float(values[i]), self.doc_ids[columns[i]]) for i in order]
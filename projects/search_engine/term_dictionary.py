@@ -0,0 +1,207 @@
+"""
+Compact document vectors over a shared term dictionary.
+
+Every concordance dict keeps its own keys, so a word appearing in a million documents
+is referenced from a million hash tables, each entry costing a pointer to the word, a
+hash and a pointer to an int object. Here every term gets an integer id once, in a
+TermDictionary, and a document vector is two parallel arrays sorted by term id:
+
+    term_ids  array('I')  4 bytes per distinct word
+    weights   array('f')  4 bytes per distinct word
+
+Because both vectors of a dot product are sorted by term id, it is computed by walking
+them side by side, like merging two sorted lists, without any hashing.
+"""
+
+import heapq
+import math
+import sys
+from array import array
+
+
+class TermDictionary:
+    """
+    Map terms to consecutive integer ids, and back.
+    """
+
+    def __init__(self):
+        self.ids = {}  # term -> id
+        self.terms = []  # id -> term
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.ids
+
+    def add(self, term):
+        """
+        Return the id of a term, giving it the next id if it is new.
+        """
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term = sys.intern(term)
+            term_id = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def get(self, term):
+        """
+        Return the id of a term, or None if it is unknown.
+        """
+        return self.ids.get(term)
+
+    def term(self, term_id):
+        return self.terms[term_id]
+
+
+class TermVector:
+    """
+    A document vector as parallel arrays of term ids and weights, sorted by term id.
+
+    Build one with TermVector.from_concordance rather than directly.
+
+    Args:
+        term_ids (array): array('I') of term ids, increasing.
+        weights (array): array('f') of the weights of those terms.
+        magnitude (float): Magnitude of the vector. Defaults to the magnitude of weights.
+    """
+
+    __slots__ = ('term_ids', 'weights', 'magnitude')
+
+    def __init__(self, term_ids, weights, magnitude=None):
+        self.term_ids = term_ids
+        self.weights = weights
+        self.magnitude = math.sqrt(sum(weight * weight for weight in weights)) if magnitude is None else magnitude
+
+    @classmethod
+    def from_concordance(cls, concordance, dictionary, add=True):
+        """
+        Convert a concordance.
+
+        Args:
+            concordance (dict): A dictionary with words as keys and their counts as values.
+            dictionary (TermDictionary): Where words get their ids.
+            add (bool): Give ids to new words. When False (for queries), unknown words
+                are left out of the vector but still count in its magnitude, like in
+                VectorCompare.relation.
+        """
+        if add:
+            pairs = sorted((dictionary.add(word), count) for word, count in concordance.items())
+        else:
+            pairs = sorted(
+                (dictionary.get(word), count) for word, count in concordance.items() if word in dictionary)
+        magnitude = math.sqrt(sum(count ** 2 for count in concordance.values()))
+        return cls(array('I', [term_id for term_id, _ in pairs]), array('f', [count for _, count in pairs]), magnitude)
+
+    def __len__(self):
+        return len(self.term_ids)
+
+    def to_concordance(self, dictionary):
+        """
+        Convert back to a concordance dict.
+        """
+        return {dictionary.term(term_id): weight for term_id, weight in zip(self.term_ids, self.weights)}
+
+    def dot(self, other):
+        """
+        Return the dot product with another TermVector of the same dictionary.
+        """
+        ids1, weights1, ids2, weights2 = self.term_ids, self.weights, other.term_ids, other.weights
+        i = j = 0
+        end1, end2 = len(ids1), len(ids2)
+        total = 0.0
+        while i < end1 and j < end2:
+            id1, id2 = ids1[i], ids2[j]
+            if id1 == id2:
+                total += weights1[i] * weights2[j]
+                i += 1
+                j += 1
+            elif id1 < id2:
+                i += 1
+            else:
+                j += 1
+        return total
+
+    def relation(self, other):
+        """
+        Return the cosine similarity with another TermVector, like VectorCompare.relation.
+        """
+        if self.magnitude == 0 or other.magnitude == 0:
+            return 0
+        return self.dot(other) / (self.magnitude * other.magnitude)
+
+    def nbytes(self):
+        """
+        Return the number of bytes taken by the arrays.
+        """
+        return self.term_ids.itemsize * len(self.term_ids) + self.weights.itemsize * len(self.weights)
+
+
+class TermVectorStore:
+    """
+    Documents stored as TermVectors sharing one TermDictionary.
+    """
+
+    def __init__(self, dictionary=None):
+        self.dictionary = dictionary if dictionary is not None else TermDictionary()
+        self.vectors = {}  # doc_id -> TermVector
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def add_document(self, doc_id, concordance):
+        """
+        Add a document.
+
+        Raises:
+            ValueError: If the document id is already stored.
+        """
+        if doc_id in self.vectors:
+            raise ValueError('Document {} is already stored'.format(doc_id))
+        self.vectors[doc_id] = TermVector.from_concordance(concordance, self.dictionary)
+
+    def vector(self, doc_id):
+        return self.vectors[doc_id]
+
+    def query_vector(self, concordance):
+        return TermVector.from_concordance(concordance, self.dictionary, add=False)
+
+    def search(self, query_concordance, k=10):
+        """
+        Compare the query with every stored document.
+
+        Returns:
+            list: Up to k (cosine similarity, doc_id) tuples sorted by descending
+            similarity, leaving out documents with no word in common with the query.
+        """
+        if k <= 0:
+            return []
+        query = self.query_vector(query_concordance)
+        scored = ((query.relation(vector), doc_id) for doc_id, vector in self.vectors.items())
+        # Only the best k are kept, in a heap, instead of sorting every match
+        return heapq.nlargest(k, (result for result in scored if result[0] > 0))
+
+    def nbytes(self):
+        """
+        Return the number of bytes taken by the vectors, not counting the dictionary.
+        """
+        return sum(sys.getsizeof(vector.term_ids) + sys.getsizeof(vector.weights) for vector in self.vectors.values())
+
+
+if __name__ == "__main__":
+    from benchmark import zipf_concordances
+
+    # A synthetic corpus whose word frequencies follow Zipf's law
+    concordances = zipf_concordances(5000, 20000, max_length=300)
+
+    store = TermVectorStore()
+    for doc_id, concordance in concordances.items():
+        store.add_document(doc_id, concordance)
+
+    # Keys are shared strings here, so only the hash tables and their entries are counted
+    dicts = sum(sys.getsizeof(concordance) for concordance in concordances.values())
+    dictionary = sys.getsizeof(store.dictionary.ids) + sys.getsizeof(store.dictionary.terms) \
+        + sum(sys.getsizeof(term) for term in store.dictionary.terms)
+    print('concordance dicts: {:6.2f} MB'.format(dicts / 1e6))
+    print('term vectors:      {:6.2f} MB + {:.2f} MB of dictionary'.format(store.nbytes() / 1e6, dictionary / 1e6))
@@ -0,0 +1,190 @@
+import re
+from collections import Counter
+
+
+ENGLISH_STOPWORDS = frozenset('''
+a about after all also an and any are as at be because been but by can could do does
+for from had has have he her him his how i if in into is it its just me more most my
+no not of on one or our out so some such than that the their them then there these
+they this those to too up us was we were what when where which who why will with would
+you your
+'''.split())
+
+
+def simple_stem(word):
+    """
+    A light English stemmer that strips the most common suffixes.
+
+    It is much less thorough than the Porter stemmer, but it is fast and maps the
+    usual plural and verb forms together, e.g. "databases" -> "database",
+    "queries" -> "query", "talking" -> "talk", "attended" -> "attend".
+    """
+    if len(word) <= 3:
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('sses'):
+        return word[:-2]
+    if word.endswith('ing') and len(word) > 5:
+        return word[:-3]
+    if word.endswith('ed') and len(word) > 4:
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+class Tokenizer:
+    """
+    Turn text into the terms that are indexed.
+
+    The pipeline is:
+        1. Splitting with a compiled regular expression. By default a token is a run of
+           letters, digits or underscores, so punctuation like "‘X’" or "89′" is dropped.
+        2. Unicode case folding of every token (str.casefold, which also folds
+           characters like the German "ß" that lower() leaves alone). Tokens are folded
+           one by one, after splitting, so tokens, spans and concordance always agree,
+           even where folding changes a character into several ("İ").
+        3. Optional stopword filtering.
+        4. Optional stemming.
+
+    Example:
+        Tokenizer().tokens("‘X’ Plaza Izazaga 89′")  # ['x', 'plaza', 'izazaga', '89']
+    """
+
+    TOKEN_PATTERN = re.compile(r'\w+')
+
+    def __init__(self, stopwords=None, stemmer=None, pattern=None):
+        """
+        Args:
+            stopwords (set): Terms to drop, for example ENGLISH_STOPWORDS.
+            stemmer (callable): Function applied to every term, for example simple_stem.
+            pattern (str or re.Pattern): Regular expression matching one token, in the
+                text before case folding.
+        """
+        self.stopwords = frozenset(stopwords) if stopwords else None
+        self.stemmer = stemmer
+        if pattern is None:
+            self.pattern = self.TOKEN_PATTERN
+        else:
+            self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+
+    def tokens(self, text):
+        """
+        Return the list of terms of a text, in order.
+        """
+        tokens = [token.casefold() for token in self.pattern.findall(text)]
+        if self.stopwords:
+            tokens = [token for token in tokens if token not in self.stopwords]
+        if self.stemmer:
+            tokens = list(map(self.stemmer, tokens))
+        return tokens
+
+    def positions(self, text):
+        """
+        Return the terms of a text with their position in it.
+
+        Positions count every token, including the stopwords that are dropped, so a
+        dropped word still leaves a gap: "cat" and "house" are not next to each other
+        in "cat of the house".
+
+        Returns:
+            list: (position, term) tuples, in order.
+        """
+        positions = []
+        for position, token in enumerate(self.pattern.findall(text)):
+            token = token.casefold()
+            if self.stopwords and token in self.stopwords:
+                continue
+            if self.stemmer:
+                token = self.stemmer(token)
+            positions.append((position, token))
+        return positions
+
+    def spans(self, text):
+        """
+        Return the terms of a text with where they are in it.
+
+        Offsets are those of the original text, even where case folding changes the
+        length of a token.
+
+        Returns:
+            list: (term, start offset, end offset) tuples, in order.
+        """
+        spans = []
+        for match in self.pattern.finditer(text):
+            token = match.group().casefold()
+            if self.stopwords and token in self.stopwords:
+                continue
+            if self.stemmer:
+                token = self.stemmer(token)
+            spans.append((token, match.start(), match.end()))
+        return spans
+
+    def concordance(self, text):
+        """
+        Count the terms of a text.
+
+        The raw tokens are counted first, so case folding, stopword filtering and
+        stemming run once per distinct word instead of once per occurrence.
+
+        Returns:
+            Counter: Terms as keys and their counts as values.
+        """
+        concordance = Counter()
+        for token, count in Counter(self.pattern.findall(text)).items():
+            token = token.casefold()
+            if self.stopwords and token in self.stopwords:
+                continue
+            if self.stemmer:
+                token = self.stemmer(token)
+            concordance[token] += count
+        return concordance
+
+
+def make_tokenizer(name):
+    """
+    Return the tokenizer for a name used on the command line.
+
+    'whitespace' returns None, which makes VectorCompare split on whitespace.
+    """
+    if name == 'whitespace':
+        return None
+    if name == 'words':
+        return Tokenizer()
+    if name == 'english':
+        return Tokenizer(stopwords=ENGLISH_STOPWORDS, stemmer=simple_stem)
+    raise ValueError('Unknown tokenizer {!r}'.format(name))
+
+
+TOKENIZER_NAMES = ('whitespace', 'words', 'english')
+
+
+if __name__ == "__main__":
+    import timeit
+
+    from vector_compare import VectorCompare, documents
+
+    def dict_loop_concordance(document):
+        # The original VectorCompare.concordance, kept here for comparison
+        con = {}
+        for word in document.split():
+            if word in con:
+                con[word] += 1
+            else:
+                con[word] = 1
+        return con
+
+    text = ' '.join(documents.values()) * 200  # About 0.7 MB of text
+    english = Tokenizer(stopwords=ENGLISH_STOPWORDS, stemmer=simple_stem)
+    candidates = [
+        ('lower() + split() + dict loop', lambda: dict_loop_concordance(text.lower())),
+        ('lower() + split() + Counter', lambda: VectorCompare().concordance(text.lower())),
+        ('Tokenizer()', lambda: Tokenizer().concordance(text)),
+        ('Tokenizer(stopwords, simple_stem)', lambda: english.concordance(text)),
+    ]
+
+    print('Concordance of {:.1f} MB of text:'.format(len(text.encode('utf-8')) / 1e6))
+    for name, function in candidates:
+        seconds = min(timeit.repeat(function, number=1, repeat=5))
+        print('{:<36} {:8.1f} ms  {:>6} terms'.format(name, seconds * 1000, len(function())))
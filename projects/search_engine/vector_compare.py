@@ -1,11 +1,91 @@
 import math  
+from collections import Counter
+from functools import lru_cache
+
+
+class DocumentVector(dict):
+    """
+    A concordance that remembers its own magnitude.
+
+    The magnitude is computed the first time it is needed and kept until the vector
+    is modified, so a document indexed once is never re-measured while it is compared
+    against many queries.
+
+    Example:
+        vector = DocumentVector({'cat': 2, 'dog': 1})
+        vector.magnitude  # 2.236..., computed once
+        vector['bird'] = 2  # the cached magnitude is discarded
+        vector.magnitude  # 3.0
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._magnitude = None
+
+    @property
+    def magnitude(self):
+        if self._magnitude is None:
+            self._magnitude = math.sqrt(sum(count ** 2 for count in self.values()))
+        return self._magnitude
+
+    # Every method that can change the counts invalidates the cached magnitude
+
+    def __setitem__(self, word, count):
+        self._magnitude = None
+        super().__setitem__(word, count)
+
+    def __delitem__(self, word):
+        self._magnitude = None
+        super().__delitem__(word)
+
+    def __ior__(self, other):
+        self._magnitude = None
+        return super().__ior__(other)
+
+    def update(self, *args, **kwargs):
+        self._magnitude = None
+        super().update(*args, **kwargs)
+
+    def setdefault(self, word, default=None):
+        self._magnitude = None
+        return super().setdefault(word, default)
+
+    def pop(self, word, *default):
+        self._magnitude = None
+        return super().pop(word, *default)
+
+    def popitem(self):
+        self._magnitude = None
+        return super().popitem()
+
+    def clear(self):
+        self._magnitude = None
+        super().clear()
+
 
 class VectorCompare:
     """
     This class provides tools to calculate the similarity between two textual documents
     using vector space techniques.
+
+    Args:
+        tokenizer (Tokenizer): Optional tokenizer (see tokenizer.py) used to build
+            concordances. Without one, documents are split on whitespace.
+        tracer (Tracer): Optional Tracer (see instrumentation.py). When given, the time
+            spent in concordance, relation and magnitude is charged to stages of the
+            same names.
     """
 
+    def __init__(self, tokenizer=None, tracer=None):
+        self.tokenizer = tokenizer
+        # A cache per instance: an lru_cache on the method would be shared by every
+        # instance and keep all of them alive
+        self.query_vector = lru_cache(maxsize=1024)(self._query_vector)
+        if tracer is not None:
+            # Wrapping the bound methods leaves untraced instances untouched
+            for stage in ('concordance', 'relation', 'magnitude'):
+                setattr(self, stage, tracer.timed(stage, getattr(self, stage)))
+
     def magnitude(self, concordance):
         """
         Calculate the magnitude (size) of a vector .
@@ -21,9 +101,12 @@ class VectorCompare:
         Raises:
             ValueError: If the input is not a dictionary.
         """
-        if type(concordance) != dict:
+        if not isinstance(concordance, dict):
             raise ValueError('Supplied Argument should be of type dict')
 
+        if isinstance(concordance, DocumentVector):
+            return concordance.magnitude  # Already computed at indexing time
+
         total = sum(count ** 2 for count in concordance.values())  # Sum of squares of word counts
         return math.sqrt(total)  # Square root of the sum
 
@@ -34,6 +117,9 @@ class VectorCompare:
         Cosine similarity is calculated as:
         (Dot Product of Vectors) / (Magnitude of Vector1 * Magnitude of Vector2)
 
+        When the arguments are DocumentVector instances their cached magnitudes are
+        reused, so only the dot product is computed on each call.
+
         Args:
             concordance1 (dict): Concordance of the first document.
             concordance2 (dict): Concordance of the second document.
@@ -44,9 +130,9 @@ class VectorCompare:
         Raises:
             ValueError: If the inputs are not dictionaries.
         """
-        if type(concordance1) != dict:
+        if not isinstance(concordance1, dict):
             raise ValueError('Supplied Argument 1 should be of type dict')
-        if type(concordance2) != dict:
+        if not isinstance(concordance2, dict):
             raise ValueError('Supplied Argument 2 should be of type dict')
 
         # Calculate the dot product of the two vectors
@@ -74,24 +160,35 @@ class VectorCompare:
             document (str): The text document to process.
 
         Returns:
-            dict: A dictionary with words as keys and their counts as values.
+            Counter: A dictionary with words as keys and their counts as values.
 
         Raises:
             ValueError: If the input is not a string.
         """
-        if type(document) != str:
+        if not isinstance(document, str):
             raise ValueError('Supplied Argument should be of type string')
 
-        con = {}
-        for word in document.split():  # Split the document into words by spaces
-            if word in con:
-                con[word] += 1  # Increment the count if the word exists
-            else:
-                con[word] = 1  # Initialize the count for a new word
-        return con
+        if self.tokenizer is not None:
+            return self.tokenizer.concordance(document)
+
+        return Counter(document.split())  # Split the document into words by spaces and count them
+
+    def _query_vector(self, query):
+        """
+        Build the vector of a search query, reusing the result for repeated queries.
+
+        The returned vector is shared between callers and must not be modified.
+
+        Args:
+            query (str): The search query.
 
+        Returns:
+            DocumentVector: The lowercased query concordance with its magnitude precomputed.
+        """
+        vector = DocumentVector(self.concordance(query.lower()))
+        vector.magnitude  # Compute the magnitude once, before the vector is shared
+        return vector
 
-v = VectorCompare()
 
 documents = {
   0:'''At Scale You Will Hit Every Performance Issue I used to think I knew a bit about performance scalability and how to keep things trucking when you hit large amounts of data Truth is I know diddly squat on the subject since the most I have ever done is read about how its done To understand how I came about realising this you need some background''',
@@ -104,26 +201,23 @@ documents = {
   7:''' Durante las últimas horas, en la red social de ‘X’ se colocó en tendencia el nombre del conductor de espectáculos, PEDRO SOLA , quien encabezaría una controversia con el titular de la Secretaría de Economía, Marcelo Ebrard. Dicha situación se desencadenó con motivo a las declaraciones de ambos personajes públicos con referencia al cateo realizado en la Plaza Izazaga 89, en la Ciudad de México. El pasado 28 de noviembre, Marcelo Ebrard Casaubón anunció la incautación de un establecimiento comercial que se ubicaba en la alcaldía Cuauhtémoc, el cual era conocido bajo el nombre de ‘Plaza Izazaga 89′, en el inmueble las autoridades decomisaron un total de 88 mil productos que, presuntamente, fueron ingresados ingresados de forma ilegal.''',
 }
 
-index = {
-0:v.concordance(documents[0].lower()),
-1:v.concordance(documents[1].lower()),
-2:v.concordance(documents[2].lower()),
-3:v.concordance(documents[3].lower()),
-4:v.concordance(documents[4].lower()),
-5:v.concordance(documents[5].lower()),
-6:v.concordance(documents[6].lower()),
-7:v.concordance(documents[7].lower()),
-}
+if __name__ == "__main__":
+    from inverted_index import InvertedIndex
+    from snippets import SnippetStore
+    from tokenizer import Tokenizer
+
+    v = VectorCompare(Tokenizer())
 
-searchterm = input('Enter Search Term: ')
-matches = []
+    index = InvertedIndex()
+    snippets = SnippetStore(v.tokenizer)
+    for i in documents:
+        index.add_document(i, DocumentVector(v.concordance(documents[i].lower())))
+        snippets.add_document(i, documents[i])
 
-for i in range(len(index)):
-  relation = v.relation(v.concordance(searchterm.lower()),index[i])
-  if relation > 0:
-    matches.append((relation,documents[i][:150]))
+    searchterm = input('Enter Search Term: ')
 
-matches.sort(reverse=True)
+    # Only documents sharing at least one word with the query are scored, and only the best 10 are kept
+    matches = index.search(v.query_vector(searchterm), k=10)
 
-for i in matches:
-  print(i[0],i[1])
\ No newline at end of file
+    for (relation, i), snippet in zip(matches, snippets.snippets(matches, searchterm, highlight=('*', '*'))):
+        print(relation, snippet)